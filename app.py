@@ -1,14 +1,75 @@
 # app.py
-from config import app, db
+from config import app, db, scheduler
+import fcntl
 import os
+from assets import assets_blueprint, schedule_asset_sweeper
+from auth import schedule_revocation_purge
 from blueprint import api_v1_blueprint
+import commands  # noqa: F401 registers flask CLI commands
+from catalog import init_category_closure
+from idempotency import schedule_idempotency_purge
+from images import schedule_image_recovery
+from inventory import schedule_hold_sweeper
+from search import init_search_index
 
 app.register_blueprint(api_v1_blueprint)
+app.register_blueprint(assets_blueprint)
+
+_scheduler_lock = None
+
+
+def init_database():
+    """Create missing tables and indexes.
+
+    gunicorn runs this once in the master (gunicorn.conf.py); its connections
+    are closed afterwards so the forked workers never share one.
+    """
+    with app.app_context():
+        db.create_all()
+        init_search_index()
+        init_category_closure()
+        db.engine.dispose()
+
+
+def start_scheduler():
+    """Start the background jobs unless another process already runs them.
+
+    Every gunicorn worker calls this and the one that locks
+    SCHEDULER_LOCK_FILE wins. The lock dies with its process, so the worker
+    gunicorn starts in place of the holder takes the jobs over.
+    """
+    global _scheduler_lock
+    if not app.config["SCHEDULER_ENABLED"] or scheduler.running:
+        return False
+    lock = open(app.config["SCHEDULER_LOCK_FILE"], "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _scheduler_lock = lock  # kept open for the life of the process
+
+    schedule_asset_sweeper()
+    schedule_image_recovery()
+    schedule_revocation_purge()
+    schedule_hold_sweeper()
+    schedule_idempotency_purge()
+    scheduler.start()
+    return True
+
+
+def bootstrap():
+    """Create missing tables and indexes, then start the background jobs.
+
+    Not run on import: password hashing processes are spawned and re-import
+    __main__, and must not repeat any of this.
+    """
+    init_database()
+    start_scheduler()
 
-with app.app_context():
-    db.create_all()
 
 if __name__ == "__main__":
+    bootstrap()
     upload_dir = app.config["UPLOAD_DIR"]
     if not os.path.exists(upload_dir):
         os.makedirs(upload_dir, exist_ok=True)
@@ -0,0 +1,258 @@
+# assets.py
+import hashlib
+import mimetypes
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, send_from_directory
+from sqlalchemy import case, delete, event, select, update
+from werkzeug.security import safe_join
+
+from config import app, db, scheduler
+from models import Asset, Product, ProductImage
+from utils import dialect_insert
+
+CHUNK_SIZE = 64 * 1024
+# Largest first: each variant is downscaled from the previous one
+IMAGE_VARIANTS = (
+    ("zoom", (1600, 1600)),
+    ("listing", (480, 480)),
+    ("thumbnail", (160, 160)),
+)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Content-addressed files: "<sha256>_<variant>.<ext>" never change once written
+CONTENT_ADDRESSED = re.compile(r"^([0-9a-f]{64}_[a-z]+)\.[a-z]+$")
+_asset_table = Asset.__table__
+
+assets_blueprint = Blueprint("assets", __name__)
+
+
+def asset_url(filename):
+    return f"{app.config['ASSET_BASE_URL'].rstrip('/')}/{filename}"
+
+
+def variant_filename(digest, variant):
+    return f"{digest}_{variant}.{app.config['IMAGE_FORMAT']}"
+
+
+def variant_urls(digest):
+    return {
+        f"{variant}_url": asset_url(variant_filename(digest, variant))
+        for variant, _ in IMAGE_VARIANTS
+    }
+
+
+@assets_blueprint.route("/assets/<path:filename>")
+def serve_asset(filename):
+    """Serve an uploaded image, or hand it to the front proxy.
+
+    Content-addressed files get a strong ETag and a year of immutable caching.
+    Without offloading, send_file answers Range and conditional requests and
+    passes the open file to the server's wsgi.file_wrapper (sendfile).
+    """
+    directory = os.path.abspath(app.config["UPLOAD_DIR"])
+    match = CONTENT_ADDRESSED.match(filename)
+    max_age = IMMUTABLE_MAX_AGE if match else app.config["ASSET_MAX_AGE"]
+
+    if app.config["ASSET_OFFLOAD"] == "x-accel":
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        )
+        response.headers["X-Accel-Redirect"] = (
+            app.config["ASSET_ACCEL_PREFIX"].rstrip("/") + "/" + filename
+        )
+        if match:
+            response.set_etag(match.group(1))
+    else:
+        response = send_from_directory(
+            directory,
+            filename,
+            etag=match.group(1) if match else True,
+            max_age=max_age,
+        )
+        response.accept_ranges = "bytes"
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = bool(match)
+    return response
+
+
+def write_upload(upload, directory):
+    """Stream an upload to a temp file, hashing it on the way.
+
+    Returns (path, sha256 hex digest, size in bytes).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"upload-{uuid.uuid4().hex}")
+    digest, size = hashlib.sha256(), 0
+    with open(path, "wb") as fh:
+        for chunk in iter(lambda: upload.stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            fh.write(chunk)
+            size += len(chunk)
+    return path, digest.hexdigest(), size
+
+
+def claim_asset(digest, size):
+    """Register an asset (or revive an unreferenced one) and return its status.
+
+    "ready" means the variants already exist and the upload can be discarded.
+    Runs in the caller's transaction, so a concurrent sweep of the same digest
+    either finishes first (and the asset comes back as pending) or waits.
+    """
+    statement = dialect_insert(_asset_table).values(
+        digest=digest, size=size, status="pending", ref_count=0
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[_asset_table.c.digest],
+        set_={"released_at": None},
+    ).returning(_asset_table.c.status)
+    return db.session.execute(statement).scalar_one()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_variants(digest):
+    for variant, _ in IMAGE_VARIANTS:
+        _remove(
+            os.path.join(app.config["UPLOAD_DIR"], variant_filename(digest, variant))
+        )
+
+
+def sweep_assets(batch_size=None, grace=None):
+    """Delete up to batch_size unreferenced assets and their files.
+
+    Each row is deleted with its ref_count re-checked and its files removed
+    before the commit, so an upload reclaiming the digest meanwhile either
+    keeps the row or blocks until the files are gone and reprocesses.
+    """
+    batch_size = batch_size or app.config["ASSET_GC_BATCH"]
+    grace = app.config["ASSET_GC_GRACE"] if grace is None else grace
+    cutoff = datetime.utcnow() - timedelta(seconds=grace)
+    reclaimable = (Asset.ref_count == 0, Asset.released_at < cutoff)
+
+    digests = db.session.scalars(
+        select(Asset.digest).where(*reclaimable).limit(batch_size)
+    ).all()
+    removed = 0
+    for digest in digests:
+        result = db.session.execute(
+            delete(Asset).where(Asset.digest == digest, *reclaimable)
+        )
+        if result.rowcount:
+            remove_variants(digest)
+            removed += 1
+    db.session.commit()
+    return removed
+
+
+def sweep_staged_uploads(grace=None):
+    """Remove staged uploads left behind by crashed requests or workers."""
+    grace = app.config["ASSET_GC_GRACE"] if grace is None else grace
+    directory = app.config["UPLOAD_TMP_DIR"]
+    if not os.path.isdir(directory):
+        return 0
+    cutoff, removed = time.time() - grace, 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    return removed
+
+
+def untracked_files(batch_size=1000):
+    """Files in UPLOAD_DIR that no asset, product or product image refers to.
+
+    These predate the asset store; yields at most batch_size filenames.
+    """
+    digests = set(db.session.scalars(select(Asset.digest)))
+    referenced = {
+        url.rsplit("/", 1)[-1]
+        for url in db.session.scalars(
+            select(ProductImage.url).union(select(Product.imgUrl))
+        )
+        if url
+    }
+    found = 0
+    with os.scandir(app.config["UPLOAD_DIR"]) as it:
+        for entry in it:
+            if found >= batch_size:
+                return
+            name = entry.name
+            if not entry.is_file() or name in referenced:
+                continue
+            if name.partition("_")[0] in digests:
+                continue
+            found += 1
+            yield name
+
+
+def _sweep_job():
+    with app.app_context():
+        sweep_assets()
+        sweep_staged_uploads()
+
+
+def schedule_asset_sweeper():
+    scheduler.add_job(
+        _sweep_job,
+        "interval",
+        seconds=app.config["ASSET_GC_INTERVAL"],
+        id="sweep-assets",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
+
+
+def _adjust_refs(connection, digest, delta):
+    if digest is None:
+        return
+    remaining = _asset_table.c.ref_count + delta
+    connection.execute(
+        update(_asset_table)
+        .where(_asset_table.c.digest == digest)
+        .values(
+            ref_count=remaining,
+            released_at=case(
+                (remaining <= 0, datetime.utcnow()),
+                else_=None,
+            ),
+        )
+    )
+
+
+@event.listens_for(ProductImage, "after_insert")
+def _ref_on_insert(mapper, connection, target):
+    _adjust_refs(connection, target.asset_digest, 1)
+
+
+@event.listens_for(ProductImage, "after_update")
+def _ref_on_update(mapper, connection, target):
+    history = db.inspect(target).attrs.asset_digest.history
+    if not history.has_changes():
+        return
+    for digest in history.deleted:
+        _adjust_refs(connection, digest, -1)
+    for digest in history.added:
+        _adjust_refs(connection, digest, 1)
+
+
+@event.listens_for(ProductImage, "after_delete")
+def _ref_on_delete(mapper, connection, target):
+    _adjust_refs(connection, target.asset_digest, -1)
@@ -0,0 +1,211 @@
+# auth.py
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from cache import get_cache, mark_tables_changed
+from config import app, db, jwt, scheduler
+from models import RevokedToken, Role
+from utils import dialect_insert
+
+# Re-read rows this far back so late commits or clock skew between hosts are not missed
+SYNC_OVERLAP = timedelta(seconds=30)
+
+_roles = {"version": None, "levels": {}}
+_roles_lock = threading.Lock()
+
+
+def role_levels():
+    """Role name -> level, held per worker and reloaded after any role write.
+
+    Staleness is detected through the "roles" change version the cache layer
+    bumps on every commit touching the roles table, so a change made by one
+    worker reaches the others without a database round trip per request.
+    """
+    version = get_cache().get_version("roles")
+    if _roles["version"] != version:
+        with _roles_lock:
+            if _roles["version"] != version:
+                levels = dict(
+                    db.session.execute(db.select(Role.name, Role.level)).all()
+                )
+                _roles.update(version=version, levels=levels)
+    return _roles["levels"]
+
+
+def role_claims(user):
+    """Signed JWT claims used to authorise requests without loading the user."""
+    role = user.role
+    return {
+        "email": user.email,
+        "role": role.name if role else "user",
+        "role_level": role.level if role else None,
+    }
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter: no false negatives, error_rate false positives."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RevocationStore:
+    """Revoked token ids in a shared table, fronted per worker.
+
+    The Bloom filter holds every revoked jti this worker knows of, so the usual
+    "not revoked" answer needs no I/O. Possible hits are settled by the table
+    and remembered in a small LRU. Logouts from other workers arrive through
+    the "revoked_tokens" change version, checked at most every
+    REVOCATION_SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._answers = OrderedDict()
+        self._version = None
+        self._synced_at = 0.0
+        self._loaded_until = None
+
+    def _reset(self, capacity):
+        self._bloom = BloomFilter(capacity, app.config["REVOCATION_BLOOM_ERROR_RATE"])
+        self._answers.clear()
+        self._loaded_until = None
+
+    def _load(self):
+        now = datetime.utcnow()
+        query = select(RevokedToken.jti, RevokedToken.revoked_at).where(
+            RevokedToken.expires_at > now
+        )
+        if self._loaded_until is not None:
+            query = query.where(
+                RevokedToken.revoked_at >= self._loaded_until - SYNC_OVERLAP
+            )
+        for jti, revoked_at in db.session.execute(query):
+            self._bloom.add(jti)
+            if self._loaded_until is None or revoked_at > self._loaded_until:
+                self._loaded_until = revoked_at
+        if self._loaded_until is None:
+            self._loaded_until = now
+        # Rebuild bigger once the filter is past its designed capacity
+        if self._bloom.count > self._bloom.capacity:
+            self._reset(self._bloom.capacity * 2)
+            self._load()
+
+    def _sync(self):
+        if time.monotonic() - self._synced_at < app.config["REVOCATION_SYNC_INTERVAL"]:
+            return
+        version = get_cache().get_version("revoked_tokens")
+        if self._bloom is None:
+            self._reset(app.config["REVOCATION_BLOOM_CAPACITY"])
+        if version != self._version:
+            self._load()
+            # Cached "not revoked" answers may be stale now
+            for jti in [jti for jti, revoked in self._answers.items() if not revoked]:
+                del self._answers[jti]
+            self._version = version
+        self._synced_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        with self._lock:
+            self._sync()
+            if jti not in self._bloom:
+                return False
+            if jti in self._answers:
+                self._answers.move_to_end(jti)
+                return self._answers[jti]
+        revoked = db.session.get(RevokedToken, jti) is not None
+        with self._lock:
+            self._answers[jti] = revoked
+            while len(self._answers) > app.config["REVOCATION_LRU_SIZE"]:
+                self._answers.popitem(last=False)
+        return revoked
+
+    def revoke(self, jti, expires_at):
+        db.session.execute(
+            dialect_insert(RevokedToken.__table__)
+            .values(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["jti"])
+        )
+        mark_tables_changed(db.session, "revoked_tokens")
+        db.session.commit()
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+                self._answers[jti] = True
+
+
+revocations = RevocationStore()
+
+
+def revoke_token(claims):
+    """Revoke a decoded access token until the moment it would expire."""
+    expires_at = datetime.utcfromtimestamp(claims["exp"]) if "exp" in claims else None
+    revocations.revoke(claims["jti"], expires_at or datetime.max)
+
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_payload):
+    return revocations.is_revoked(jwt_payload["jti"])
+
+
+def purge_revoked_tokens(batch_size=1000):
+    """Delete revocations of tokens that have expired anyway, in batches."""
+    total = 0
+    while True:
+        expired = select(RevokedToken.jti).where(
+            RevokedToken.expires_at <= datetime.utcnow()
+        )
+        result = db.session.execute(
+            delete(RevokedToken).where(
+                RevokedToken.jti.in_(expired.limit(batch_size).scalar_subquery())
+            )
+        )
+        db.session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+def _purge_job():
+    with app.app_context():
+        purge_revoked_tokens()
+
+
+def schedule_revocation_purge():
+    scheduler.add_job(
+        _purge_job,
+        "interval",
+        seconds=app.config["REVOCATION_PURGE_INTERVAL"],
+        id="purge-revoked-tokens",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
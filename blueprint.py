@@ -1,18 +1,26 @@
 from flask import Blueprint
 from flask_restful import Api
+from compression import compress_response
 from resources import (  # Import your resource classes
     AddressResource,
     BrandResource,
     CategoryResource,
+    CategoryTreeResource,
     CustomerResource,
+    FitmentResource,
     InventoryLogResource,
     LoginUser,
     LogoutUser,
     OrderItemResource,
     OrderProcess,
     OrderResource,
+    PasswordHashMetricsResource,
     ProductResource,
+    ProductBulkUpdateResource,
+    ProductExportResource,
+    ProductImportResource,
     ProductRoute,
+    ProductSearchResource,
     RegisterUser,
     ReviewResource,
     RoleResource,
@@ -22,6 +30,7 @@ from resources import (  # Import your resource classes
 # Create a Blueprint for API v1
 api_v1_blueprint = Blueprint("api_v1", __name__, url_prefix="/api/v1")
 api = Api(api_v1_blueprint)
+api_v1_blueprint.after_request(compress_response)
 
 # Register resources with Flask-RESTful API
 
@@ -29,9 +38,11 @@ api = Api(api_v1_blueprint)
 api.add_resource(RegisterUser, "/register")
 api.add_resource(LoginUser, "/login")
 api.add_resource(LogoutUser, "/logout")
+api.add_resource(PasswordHashMetricsResource, "/metrics/password-hashing")
 
 # categories
 api.add_resource(CategoryResource, "/categories", "/category/<int:id>")
+api.add_resource(CategoryTreeResource, "/category/<int:id>/tree")
 
 # brands
 api.add_resource(BrandResource, "/brands", "/brands/<int:id>")
@@ -39,6 +50,11 @@ api.add_resource(BrandResource, "/brands", "/brands/<int:id>")
 # products
 api.add_resource(ProductResource, "/products", "/product/<int:id>")
 api.add_resource(ProductRoute, "/create-product")
+api.add_resource(ProductSearchResource, "/products/search")
+api.add_resource(ProductImportResource, "/products/import")
+api.add_resource(ProductExportResource, "/products/export")
+api.add_resource(ProductBulkUpdateResource, "/products/bulk")
+api.add_resource(FitmentResource, "/fitment")
 # api.add_resource(ProductResource, "/getAll")
 
 # customers
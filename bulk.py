@@ -0,0 +1,502 @@
+# bulk.py
+import csv
+import io
+import json
+import time
+import zlib
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import (
+    Boolean,
+    Float,
+    Integer,
+    Text,
+    bindparam,
+    cast,
+    column,
+    func,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy import values as values_clause
+from sqlalchemy.exc import DBAPIError
+
+from cache import mark_tables_changed
+from config import app, db
+from fitment import refresh_fitments
+from models import Brand, Category, InventoryLog, Product
+from search import reindex_products
+from utils import dialect_insert
+
+_product_table = Product.__table__
+# Columns an import row may set; lookups fill category_id and brand_id.
+# reserved belongs to the stock holds and is never imported.
+IMPORT_COLUMNS = tuple(
+    c.name
+    for c in _product_table.columns
+    if c.name not in ("id", "created_at", "reserved") and c.computed is None
+)
+EXPORT_COLUMNS = tuple(c.name for c in _product_table.columns)
+REQUIRED_FOR_NEW = ("name", "price", "category_id")
+# Values for NOT NULL columns a new row may leave out
+NEW_ROW_DEFAULTS = {"description": "", "imgUrl": "", "stock": 0, "status": "Active"}
+# Columns a bulk price/stock update may change
+UPDATE_COLUMNS = ("price", "stock", "discount")
+BOOLEAN_VALUES = {"true": True, "1": True, "yes": True}
+BOOLEAN_VALUES.update({"false": False, "0": False, "no": False})
+
+
+class ImportReport:
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.created = self.updated = self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, line, sku, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "sku": sku, "error": message})
+
+    def to_dict(self):
+        seconds = time.perf_counter() - self.started
+        processed = self.created + self.updated + self.failed
+        return {
+            "rows": processed,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(processed / seconds) if seconds else processed,
+        }
+
+
+def detect_format(fmt=None, filename=None, content_type=None):
+    """Resolve "csv" or "ndjson" from an explicit value, extension or mimetype."""
+    hints = [
+        (fmt or "").lower(),
+        (filename or "").rsplit(".", 1)[-1].lower(),
+        (content_type or "").lower(),
+    ]
+    for hint in hints:
+        if "csv" in hint:
+            return "csv"
+        if any(name in hint for name in ("ndjson", "jsonl", "json")):
+            return "ndjson"
+    raise ValueError("Unknown format: use csv or ndjson")
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) from a binary stream without reading it whole."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        yield line_number, (
+            row
+            if isinstance(row, dict)
+            else ValueError("Each line must be a JSON object")
+        )
+
+
+def _lookup_map(model):
+    """Map id, slug and lower-cased name to the row id."""
+    lookup = {}
+    for id_, slug, name in db.session.execute(select(model.id, model.slug, model.name)):
+        lookup[str(id_)] = id_
+        lookup[slug.lower()] = id_
+        lookup.setdefault(name.lower(), id_)
+    return lookup
+
+
+def _coerce(column, value):
+    if isinstance(column.type, Boolean):
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() not in BOOLEAN_VALUES:
+            raise ValueError(f"{column.name}: expected a boolean")
+        return BOOLEAN_VALUES[str(value).lower()]
+    if isinstance(column.type, Integer):
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{column.name}: expected an integer")
+        return int(number)
+    if isinstance(column.type, Float):
+        return float(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value).strip()
+
+
+def validate_row(raw, categories, brands):
+    """Return (sku, values) for a raw row, raising ValueError on bad input."""
+    values = {}
+    for key, value in raw.items():
+        if key in ("category", "category_id"):
+            key, lookup = "category_id", categories
+        elif key in ("brand", "brand_id"):
+            key, lookup = "brand_id", brands
+        elif key in IMPORT_COLUMNS:
+            lookup = None
+        else:
+            continue  # unknown columns are ignored
+        if value is None or value == "":
+            continue  # blank cells leave the stored value alone
+        if lookup is not None:
+            resolved = lookup.get(str(value).strip().lower())
+            if resolved is None:
+                raise ValueError(f"Unknown {key[:-3]}: {value}")
+            values[key] = resolved
+            continue
+        try:
+            values[key] = _coerce(_product_table.c[key], value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e) if key in str(e) else f"{key}: {e}")
+
+    sku = values.get("sku")
+    if not sku:
+        raise ValueError("sku is required")
+    for key in ("price", "cost", "stock"):
+        if values.get(key) is not None and values[key] < 0:
+            raise ValueError(f"{key} must not be negative")
+    return sku, values
+
+
+def _write_batch(batch, report):
+    """Upsert one batch of validated (line, sku, values) rows.
+
+    Existing SKUs get an UPDATE per distinct column set (executemany); new
+    SKUs are inserted with ON CONFLICT (sku) DO UPDATE in case another
+    import created them meanwhile.
+    """
+    skus = [sku for _, sku, _ in batch]
+    existing = set(db.session.scalars(select(Product.sku).where(Product.sku.in_(skus))))
+    inserts, updates = [], {}
+    for line, sku, values in batch:
+        if sku in existing:
+            columns = tuple(sorted(k for k in values if k != "sku"))
+            updates.setdefault(columns, []).append(
+                {f"b_{k}": v for k, v in values.items()}
+            )
+            continue
+        missing = [k for k in REQUIRED_FOR_NEW if k not in values]
+        if missing:
+            report.error(line, sku, f"New product needs {', '.join(missing)}")
+            continue
+        row = {column: None for column in IMPORT_COLUMNS}
+        row.update(NEW_ROW_DEFAULTS)
+        row.update(values)
+        inserts.append(row)
+
+    for columns, rows in updates.items():
+        if columns:
+            db.session.execute(
+                update(_product_table)
+                .where(_product_table.c.sku == bindparam("b_sku"))
+                .values({c: bindparam(f"b_{c}") for c in columns}),
+                rows,
+            )
+        report.updated += len(rows)
+    if inserts:
+        statement = dialect_insert(_product_table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[_product_table.c.sku],
+            set_={c: statement.excluded[c] for c in IMPORT_COLUMNS if c != "sku"},
+        )
+        db.session.execute(statement, inserts)
+        report.created += len(inserts)
+
+    ids = db.session.scalars(select(Product.id).where(Product.sku.in_(skus))).all()
+    reindex_products(ids)
+    # Fitments only change when a row carries compatibility data
+    fitment_skus = [
+        sku
+        for _, sku, values in batch
+        if "compatible_makes" in values or "compatible_models" in values
+    ]
+    if fitment_skus:
+        refresh_fitments(
+            db.session.connection(),
+            db.session.scalars(
+                select(Product.id).where(Product.sku.in_(fitment_skus))
+            ).all(),
+        )
+    mark_tables_changed(db.session, "products", "product_fitments")
+
+
+def _flush(batch, report):
+    counts = report.created, report.updated, report.failed, len(report.errors)
+    try:
+        _write_batch(batch, report)
+        db.session.commit()
+    except (DBAPIError, TypeError, ValueError) as e:
+        # Database errors, or a derived write (fitments, search) failing on a row
+        db.session.rollback()
+        report.created, report.updated, report.failed, errors = counts
+        del report.errors[errors:]
+        if len(batch) == 1:
+            line, sku, _ = batch[0]
+            message = "Rejected by the database" if isinstance(e, DBAPIError) else e
+            report.error(line, sku, str(message))
+            return
+        # Isolate the offending rows by writing the batch one row at a time
+        for row in batch:
+            _flush([row], report)
+
+
+def import_products(stream, fmt, batch_size=None, max_errors=None):
+    """Stream rows from a CSV or NDJSON file into products, upserting by sku.
+
+    Rows are validated as they are read and written batch_size at a time,
+    one transaction per batch. Returns the ImportReport as a dict.
+    """
+    batch_size = batch_size or app.config["IMPORT_BATCH_SIZE"]
+    report = ImportReport(max_errors or app.config["IMPORT_MAX_ERRORS"])
+    categories, brands = _lookup_map(Category), _lookup_map(Brand)
+
+    rows = read_rows(stream, fmt)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        # Later rows for the same sku win, as they would row by row
+        batch = {}
+        for line, raw in chunk:
+            if isinstance(raw, Exception):
+                report.error(line, None, str(raw))
+                continue
+            try:
+                sku, values = validate_row(raw, categories, brands)
+            except ValueError as e:
+                report.error(line, raw.get("sku"), str(e))
+                continue
+            previous = batch.pop(sku, None)
+            if previous:
+                values = {**previous[2], **values}
+            batch[sku] = (line, sku, values)
+        if batch:
+            _flush(list(batch.values()), report)
+    return report.to_dict()
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(" ", "seconds")
+    return value
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(app.config["GZIP_LEVEL"], zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_products(clauses, fmt, columns=None, compress=False):
+    """Yield the matching products as CSV or NDJSON bytes, optionally gzipped.
+
+    Rows come from a server-side cursor EXPORT_BATCH_SIZE at a time as plain
+    tuples, and each batch is encoded and yielded before the next is fetched,
+    so memory stays flat regardless of catalog size.
+    """
+    columns = tuple(columns or EXPORT_COLUMNS)
+    statement = (
+        select(*(_product_table.c[name] for name in columns))
+        .where(*clauses)
+        .order_by(_product_table.c.id)
+        .execution_options(yield_per=app.config["EXPORT_BATCH_SIZE"])
+    )
+
+    def encode():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(columns)
+        for partition in db.session.execute(statement).partitions():
+            for row in partition:
+                values = [_export_value(value) for value in row]
+                if fmt == "csv":
+                    writer.writerow(values)
+                else:
+                    buffer.write(
+                        json.dumps(dict(zip(columns, values)), separators=(",", ":"))
+                    )
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    return _gzip(encode()) if compress else encode()
+
+
+def _update_item(raw):
+    """Validate one {sku, price?, stock?, discount?} item into (sku, changes)."""
+    if not isinstance(raw, dict):
+        raise ValueError("Each item must be an object with a sku")
+    sku = str(raw.get("sku") or "").strip()
+    if not sku:
+        raise ValueError("sku is required")
+    changes = {}
+    for key in UPDATE_COLUMNS:
+        value = raw.get(key)
+        if value is None or value == "":
+            continue
+        try:
+            changes[key] = _coerce(_product_table.c[key], value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(str(e) if key in str(e) else f"{key}: {e}")
+        if changes[key] < 0:
+            raise ValueError(f"{key} must not be negative")
+    if changes.get("discount", 0) > 100:
+        raise ValueError("discount must be a percentage between 0 and 100")
+    if not changes:
+        raise ValueError(f"Nothing to update: give one of {', '.join(UPDATE_COLUMNS)}")
+    return sku, changes
+
+
+def _apply_changes(rows):
+    """Set-based UPDATE of {id, price, stock, discount} rows (None keeps)."""
+    table = _product_table
+    if db.engine.dialect.name == "postgresql":
+        changes = values_clause(
+            column("id", Integer),
+            *(column(name, Text) for name in UPDATE_COLUMNS),
+            name="changes",
+        ).data([(row["id"], *(row[name] for name in UPDATE_COLUMNS)) for row in rows])
+        db.session.execute(
+            update(table)
+            .where(table.c.id == changes.c.id)
+            .values(
+                {
+                    name: func.coalesce(
+                        cast(changes.c[name], table.c[name].type), table.c[name]
+                    )
+                    for name in UPDATE_COLUMNS
+                }
+            )
+        )
+        return
+    # SQLite cannot alias VALUES columns; one prepared executemany is as cheap
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values(
+            {
+                name: func.coalesce(bindparam(f"b_{name}"), table.c[name])
+                for name in UPDATE_COLUMNS
+            }
+        ),
+        [{f"b_{key}": value for key, value in row.items()} for row in rows],
+    )
+
+
+def _update_chunk(items, lines, summary, log_fields):
+    current = {
+        row.sku: row
+        for row in db.session.execute(
+            select(
+                Product.id,
+                Product.sku,
+                Product.reserved,
+                *(Product.__table__.c[c] for c in UPDATE_COLUMNS),
+            )
+            .where(Product.sku.in_(list(items)))
+            .with_for_update()
+        )
+    }
+    rows, logs = [], []
+    for sku, changes in items.items():
+        row = current.get(sku)
+        if row is None:
+            summary["unknown"].append(sku)
+            continue
+        if changes.get("stock", row.reserved) < row.reserved:
+            # The rows are locked, so no hold can be taken meanwhile
+            summary["errors"].append(
+                {
+                    "line": lines[sku],
+                    "error": f"{sku}: stock must not be below the {row.reserved} "
+                    "units held for unpaid orders",
+                }
+            )
+            continue
+        changed = {k: v for k, v in changes.items() if getattr(row, k) != v}
+        if not changed:
+            summary["unchanged"] += 1
+            continue
+        summary["affected"] += 1
+        rows.append({"id": row.id, **{c: changed.get(c) for c in UPDATE_COLUMNS}})
+        if "stock" in changed:
+            logs.append(
+                {
+                    "product_id": row.id,
+                    "quantity_change": changed["stock"] - row.stock,
+                    "previous_stock": row.stock,
+                    "new_stock": changed["stock"],
+                    **log_fields,
+                }
+            )
+    if rows:
+        _apply_changes(rows)
+        mark_tables_changed(db.session, "products")
+    if logs:
+        db.session.execute(insert(InventoryLog), logs)
+        mark_tables_changed(db.session, "inventory_logs")
+    db.session.commit()
+
+
+def bulk_update_products(
+    items, change_type="adjustment", reference_id=None, notes=None, created_by=None
+):
+    """Apply (sku, price, stock, discount) changes chunk by chunk.
+
+    Each chunk locks its products, updates the changed ones in one set-based
+    statement and inserts InventoryLog rows for stock changes in the same
+    transaction. Stock may not drop below what is held for unpaid orders.
+    Returns counts of affected and unchanged products plus the unknown SKUs
+    and invalid items.
+    """
+    summary = {"affected": 0, "unchanged": 0, "unknown": [], "errors": []}
+    log_fields = {
+        "change_type": change_type,
+        "reference_id": reference_id,
+        "notes": notes,
+        "created_by": created_by,
+    }
+    chunk_size = app.config["BULK_UPDATE_CHUNK_SIZE"]
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        changes, lines = {}, {}
+        for index, raw in chunk:
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                sku, item = _update_item(raw)
+            except ValueError as e:
+                summary["errors"].append({"line": index, "error": str(e)})
+                continue
+            changes.setdefault(sku, {}).update(item)
+            lines[sku] = index
+        if changes:
+            _update_chunk(changes, lines, summary, log_fields)
+    return summary
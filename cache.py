@@ -0,0 +1,321 @@
+# cache.py
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import app
+from serializers import encode_json
+
+# Content codings compress_response can produce, in order of preference
+CONTENT_ENCODINGS = ("br", "gzip")
+
+LOCK_STRIPES = 256
+
+
+def _digest(key):
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class MemoryCache:
+    """Per-process LRU with a TTL per entry.
+
+    Versions are only process wide, so on its own it suits a single worker.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        # Unchanged tables start from a per-process epoch, never a fixed value
+        # an ETag from before a restart could still match
+        self._epoch = uuid.uuid4().hex
+        self._mutex = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def get(self, key):
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._mutex:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, name):
+        return self._versions.get(name, self._epoch)
+
+    def bump_version(self, name):
+        self._versions[name] = uuid.uuid4().hex
+
+    @contextmanager
+    def lock(self, key, timeout):
+        lock = self._locks[int(_digest(key)[:8], 16) % LOCK_STRIPES]
+        acquired = lock.acquire(timeout=timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+
+
+class FileSystemCache:
+    """Cache shared by every worker on the host, stored as files in a directory.
+
+    Writes go through a temp file and os.replace so readers never see a partial
+    entry; cross-process locks use flock on a fixed set of striped lock files.
+    """
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data):
+        tmp = self._path(f".{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, self._path(name))
+
+    def get(self, key):
+        try:
+            with open(self._path(_digest(key) + ".cache"), "rb") as fh:
+                expires, _, value = fh.read().partition(b"\n")
+        except FileNotFoundError:
+            return None
+        if float(expires) < time.time():
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        expires = str(time.time() + ttl).encode()
+        self._write(_digest(key) + ".cache", expires + b"\n" + value)
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".cache"):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        continue
+        for _, path in sorted(entries)[: max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get_version(self, name):
+        try:
+            with open(self._path(f"version-{name}"), "rb") as fh:
+                version = fh.read().decode()
+        except FileNotFoundError:
+            version = None
+        if version:
+            return version
+        # A wiped directory must not hand out versions it handed out before
+        self.bump_version(name)
+        return self.get_version(name)
+
+    def bump_version(self, name):
+        self._write(f"version-{name}", uuid.uuid4().hex.encode())
+
+    @contextmanager
+    def lock(self, key, timeout):
+        stripe = int(_digest(key)[:8], 16) % LOCK_STRIPES
+        with open(self._path(f"lock-{stripe}"), "a+b") as fh:
+            deadline = time.monotonic() + timeout
+            acquired = False
+            while True:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        break
+                    time.sleep(0.01)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class TieredCache:
+    """Per-process memory tier in front of a shared tier.
+
+    Versions and locks always go to the shared tier so a write in one worker
+    invalidates every worker; keys embed the versions, so stale memory entries
+    simply stop being looked up.
+    """
+
+    def __init__(self, memory, shared):
+        self.memory = memory
+        self.shared = shared
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.memory.set(key, value, app.config["CACHE_MEMORY_TTL"])
+        return value
+
+    def set(self, key, value, ttl):
+        self.memory.set(key, value, min(ttl, app.config["CACHE_MEMORY_TTL"]))
+        self.shared.set(key, value, ttl)
+
+    def get_version(self, name):
+        return self.shared.get_version(name)
+
+    def bump_version(self, name):
+        self.shared.bump_version(name)
+
+    def lock(self, key, timeout):
+        return self.shared.lock(key, timeout)
+
+
+_cache = None
+
+
+def get_cache():
+    """Build the configured cache backend once per process."""
+    global _cache
+    if _cache is None:
+        backend = app.config["CACHE_BACKEND"]
+        max_entries = app.config["CACHE_MAX_ENTRIES"]
+        if backend == "memory":
+            _cache = MemoryCache(max_entries)
+        elif backend == "filesystem":
+            _cache = FileSystemCache(app.config["CACHE_DIR"], max_entries)
+        elif backend == "tiered":
+            _cache = TieredCache(
+                MemoryCache(max_entries),
+                FileSystemCache(app.config["CACHE_DIR"], max_entries * 8),
+            )
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+    return _cache
+
+
+def check_workers(workers):
+    """Refuse a per-process cache when several workers must share versions.
+
+    Cache invalidation, the role maps and token revocation all follow table
+    versions, which the memory backend keeps per process.
+    """
+    if workers > 1 and app.config["CACHE_BACKEND"] == "memory":
+        raise RuntimeError(
+            f'CACHE_BACKEND "memory" is single-worker only but {workers} workers'
+            ' are configured; use "tiered" or "filesystem"'
+        )
+
+
+def table_versions(tables):
+    cache = get_cache()
+    return ",".join(f"{table}:{cache.get_version(table)}" for table in tables)
+
+
+def _not_modified(etag):
+    """Return the If-None-Match tag matching etag or one of its encoded variants."""
+    if not request.if_none_match:
+        return None
+    for tag in (etag, *(f"{etag}-{encoding}" for encoding in CONTENT_ENCODINGS)):
+        if request.if_none_match.contains(tag):
+            return tag
+    return None
+
+
+def cached_json(tables, compute, ttl=None):
+    """Serve compute()'s payload as cached JSON bytes.
+
+    The key is the request path, the sorted query string and the current change
+    version of every table in `tables`. On a miss only one caller per key runs
+    compute(); concurrent callers wait for it and then read the stored bytes.
+    The key's digest doubles as a strong ETag, so a matching If-None-Match gets
+    a 304 before the cache or compute() is consulted.
+    """
+    cache = get_cache()
+    ttl = ttl or app.config["CACHE_TTL"]
+    args = "&".join(
+        f"{name}={value}" for name, value in sorted(request.args.items(multi=True))
+    )
+    key = f"{request.path}?{args}#{table_versions(tables)}"
+    etag = _digest(key)
+
+    matched = _not_modified(etag)
+    if matched:
+        response = app.response_class(status=304)
+        response.set_etag(matched)
+        return response
+
+    state = "HIT"
+    body = cache.get(key)
+    if body is None:
+        with cache.lock(key, app.config["CACHE_LOCK_TIMEOUT"]):
+            body = cache.get(key)
+            if body is None:
+                state = "MISS"
+                body = encode_json(compute())
+                cache.set(key, body, ttl)
+    # Lets compress_response reuse cached compressed variants of this body
+    g.cache_key, g.cache_ttl = key, ttl
+    response = app.response_class(body, status=200, mimetype="application/json")
+    response.headers["X-Cache"] = state
+    response.set_etag(etag)
+    return response
+
+
+def mark_tables_changed(session, *tables):
+    """Record writes made with Core statements, which the ORM hooks cannot see."""
+    session.info.setdefault("changed_tables", set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_tables(session, flush_context):
+    changed = session.info.setdefault("changed_tables", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            changed.add(table)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed_tables(session):
+    changed = session.info.pop("changed_tables", None)
+    if changed:
+        cache = get_cache()
+        for table in changed:
+            cache.bump_version(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_tables(session):
+    session.info.pop("changed_tables", None)
@@ -0,0 +1,316 @@
+# catalog.py
+from sqlalchemy import (
+    Integer,
+    and_,
+    case,
+    cast,
+    event,
+    exists,
+    func,
+    literal,
+    select,
+    text,
+    union_all,
+)
+from sqlalchemy.orm import selectinload
+
+from config import app, db
+from models import Category, CategoryClosure, Product, ProductImage
+from serializers import load_options, serialize, serialize_many
+from utils import str_to_bool
+
+# Sort keys accepted by ?sort= on product listings (prefix with "-" to reverse)
+PRODUCT_SORTS = {
+    "id": Product.id,
+    "created_at": Product.created_at,
+    "price": Product.price,
+    "effective_price": Product.effective_price,
+}
+
+CLOSURE_INSERT = text("""
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, CAST(:id AS INTEGER), depth + 1
+    FROM category_closure WHERE descendant_id = :parent_id
+    UNION ALL
+    SELECT CAST(:id AS INTEGER), CAST(:id AS INTEGER), 0
+    """)
+# Detach a subtree from its old ancestors, then link it under the new parent
+CLOSURE_DETACH = text("""
+    DELETE FROM category_closure
+    WHERE descendant_id IN (
+        SELECT descendant_id FROM category_closure WHERE ancestor_id = :id
+    )
+    AND ancestor_id NOT IN (
+        SELECT descendant_id FROM category_closure WHERE ancestor_id = :id
+    )
+    """)
+CLOSURE_ATTACH = text("""
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+    SELECT up.ancestor_id, down.descendant_id, up.depth + down.depth + 1
+    FROM category_closure up, category_closure down
+    WHERE up.descendant_id = :parent_id AND down.ancestor_id = :id
+    """)
+CLOSURE_REBUILD = text("""
+    INSERT INTO category_closure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM categories
+        UNION ALL
+        SELECT tree.ancestor_id, categories.id, tree.depth + 1
+        FROM tree JOIN categories ON categories.parent_id = tree.descendant_id
+    )
+    SELECT ancestor_id, descendant_id, depth FROM tree
+    """)
+
+
+def _id_list(args, name):
+    raw = args.get(name)
+    if not raw:
+        return None
+    try:
+        return [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected comma separated integers")
+
+
+def _float(args, name):
+    raw = args.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected a number")
+
+
+def category_subtree(category_ids):
+    """SELECT of the given category ids plus all of their descendants."""
+    return select(CategoryClosure.descendant_id).where(
+        CategoryClosure.ancestor_id.in_(category_ids)
+    )
+
+
+def category_in_subtree(category_id, root_id):
+    """True when category_id is root_id or one of its descendants."""
+    return db.session.query(
+        exists().where(
+            CategoryClosure.ancestor_id == root_id,
+            CategoryClosure.descendant_id == category_id,
+        )
+    ).scalar()
+
+
+def category_tree(root_id=None, fields=None):
+    """Nested categories of any depth, for the whole tree or one subtree.
+
+    Loads every needed row in a single query and links children in Python.
+    Returns a list of roots, or the root node (None if missing) for root_id.
+    """
+    query = Category.query.options(*load_options(Category, fields, ["parent_id"]))
+    if root_id is not None:
+        query = query.join(
+            CategoryClosure, CategoryClosure.descendant_id == Category.id
+        ).filter(CategoryClosure.ancestor_id == root_id)
+    categories = query.order_by(Category.id).all()
+
+    nodes = {c.id: {**serialize(c, fields), "subcategories": []} for c in categories}
+    roots = []
+    for c in categories:
+        parent = nodes.get(c.parent_id)
+        if parent is not None and c.id != root_id:
+            parent["subcategories"].append(nodes[c.id])
+        else:
+            roots.append(nodes[c.id])
+    if root_id is not None:
+        return nodes.get(root_id)
+    return roots
+
+
+def rebuild_category_closure():
+    """Recompute category_closure from categories.parent_id."""
+    db.session.execute(text("DELETE FROM category_closure"))
+    db.session.execute(CLOSURE_REBUILD)
+
+
+def init_category_closure():
+    """Populate the closure table for databases created before it existed."""
+    has_categories = db.session.query(exists().where(Category.id.isnot(None)))
+    has_closure = db.session.query(exists().where(CategoryClosure.depth.isnot(None)))
+    if has_categories.scalar() and not has_closure.scalar():
+        rebuild_category_closure()
+        db.session.commit()
+
+
+def product_filters(args):
+    """Build the WHERE clauses for a product listing, keyed by facet name.
+
+    Facets are computed with every clause except their own, so the brand counts
+    still list the other brands once a brand has been picked.
+    """
+    clauses = {}
+    category_ids = _id_list(args, "category_id")
+    if category_ids:
+        clauses["category"] = Product.category_id.in_(category_subtree(category_ids))
+    brand_ids = _id_list(args, "brand_id")
+    if brand_ids:
+        clauses["brand"] = Product.brand_id.in_(brand_ids)
+
+    min_price, max_price = _float(args, "min_price"), _float(args, "max_price")
+    price_range = []
+    if min_price is not None:
+        price_range.append(Product.price >= min_price)
+    if max_price is not None:
+        price_range.append(Product.price <= max_price)
+    if price_range:
+        clauses["price"] = and_(*price_range)
+
+    if args.get("in_stock") not in (None, ""):
+        in_stock = str_to_bool(args.get("in_stock"))
+        # Stock held for unpaid orders cannot be bought, so it does not count
+        clauses["in_stock"] = (
+            Product.available_stock > 0 if in_stock else Product.available_stock <= 0
+        )
+    if args.get("is_featured") not in (None, ""):
+        clauses["is_featured"] = Product.is_featured.is_(
+            str_to_bool(args.get("is_featured"))
+        )
+    if args.get("status"):
+        clauses["status"] = Product.status == args.get("status")
+    return clauses
+
+
+def image_mode(args):
+    """Parse ?images=: "all" embeds the gallery, "primary" only the main image."""
+    raw = (args.get("images") or "").lower()
+    if raw in ("", "0", "false", "no", "none"):
+        return None
+    if raw in ("all", "1", "true", "yes"):
+        return "all"
+    if raw == "primary":
+        return "primary"
+    raise ValueError("Invalid images: expected all or primary")
+
+
+def product_image_options(mode):
+    # One IN-query loads the gallery for the whole page
+    return [selectinload(Product.images)] if mode == "all" else []
+
+
+def primary_images(product_ids):
+    """Map product id -> primary image url with one indexed IN-query.
+
+    Prefers the resized listing variant once the image worker has written it.
+    """
+    if not product_ids:
+        return {}
+    rows = db.session.execute(
+        select(
+            ProductImage.product_id,
+            func.coalesce(ProductImage.listing_url, ProductImage.url),
+        )
+        .where(
+            ProductImage.product_id.in_(product_ids),
+            ProductImage.is_primary.is_(True),
+        )
+        .order_by(ProductImage.id)
+    )
+    primary = {}
+    for product_id, url in rows:
+        primary.setdefault(product_id, url)
+    return primary
+
+
+def serialize_products(rows, images=None, fields=None):
+    content = serialize_many(rows, fields)
+    if images == "all":
+        for data, product in zip(content, rows):
+            data["images"] = [image.url for image in product.images]
+    elif images == "primary":
+        primary = primary_images([product.id for product in rows])
+        for data, product in zip(content, rows):
+            data["primary_image"] = primary.get(product.id)
+    return content
+
+
+def _price_bucket(width):
+    if db.engine.dialect.name == "postgresql":
+        return cast(func.floor(Product.price / width), Integer)
+    # SQLite: CAST truncates, which equals floor for non-negative prices
+    return cast(Product.price / width, Integer)
+
+
+def facet_counts(clauses, bucket_width=None):
+    """Brand, category and price histogram counts in a single UNION ALL query.
+
+    The histogram has at most PRICE_BUCKET_MAX buckets; the last one is open
+    ended and takes every higher price.
+    """
+    width = bucket_width or app.config["PRICE_BUCKET_WIDTH"]
+    min_width = app.config["PRICE_BUCKET_MIN_WIDTH"]
+    if width < min_width:
+        raise ValueError(f"Invalid price_bucket: must be at least {min_width:g}")
+
+    def scoped(exclude):
+        return [clause for name, clause in clauses.items() if name != exclude]
+
+    last = app.config["PRICE_BUCKET_MAX"] - 1
+    bucket = _price_bucket(width)
+    bucket = case((bucket > last, last), else_=bucket)
+    statement = union_all(
+        select(
+            literal("brands").label("facet"),
+            Product.brand_id.label("key"),
+            func.count().label("count"),
+        )
+        .where(*scoped("brand"))
+        .group_by(Product.brand_id),
+        select(literal("categories"), Product.category_id, func.count())
+        .where(*scoped("category"))
+        .group_by(Product.category_id),
+        select(literal("price"), bucket, func.count())
+        .where(*scoped("price"))
+        .group_by(bucket),
+    )
+
+    facets = {"brands": [], "categories": [], "price": []}
+    for facet, key, count in db.session.execute(statement):
+        if facet == "price":
+            facets["price"].append(
+                {
+                    "min": key * width,
+                    "max": (key + 1) * width if key < last else None,
+                    "count": count,
+                }
+            )
+        else:
+            facets[facet].append({"id": key, "count": count})
+    facets["brands"].sort(key=lambda v: -v["count"])
+    facets["categories"].sort(key=lambda v: -v["count"])
+    facets["price"].sort(key=lambda v: v["min"])
+    return facets
+
+
+@event.listens_for(Category, "after_insert")
+def _closure_on_insert(mapper, connection, target):
+    connection.execute(CLOSURE_INSERT, {"id": target.id, "parent_id": target.parent_id})
+
+
+@event.listens_for(Category, "after_update")
+def _closure_on_move(mapper, connection, target):
+    if not db.inspect(target).attrs.parent_id.history.has_changes():
+        return
+    connection.execute(CLOSURE_DETACH, {"id": target.id})
+    if target.parent_id is not None:
+        connection.execute(
+            CLOSURE_ATTACH, {"id": target.id, "parent_id": target.parent_id}
+        )
+
+
+@event.listens_for(Category, "before_delete")
+def _closure_on_delete(mapper, connection, target):
+    connection.execute(
+        text(
+            "DELETE FROM category_closure "
+            "WHERE ancestor_id = :id OR descendant_id = :id"
+        ),
+        {"id": target.id},
+    )
@@ -0,0 +1,102 @@
+# commands.py
+import os
+
+import click
+from sqlalchemy_serializer import SerializerMixin
+
+from assets import sweep_assets, sweep_staged_uploads, untracked_files
+from bulk import detect_format, import_products
+from config import app, db
+from fitment import backfill_fitments
+from inventory import stock_contention_benchmark
+from serializers import benchmark
+
+
+@app.cli.command("backfill-fitments")
+@click.option("--batch-size", default=1000, show_default=True)
+def backfill_fitments_command(batch_size):
+    """Rebuild the product_fitments table from compatible_makes/models."""
+    total = backfill_fitments(batch_size=batch_size, echo=click.echo)
+    click.echo(f"done: {total} products processed")
+
+
+@app.cli.command("import-products")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]))
+@click.option("--batch-size", default=None, type=int)
+def import_products_command(path, fmt, batch_size):
+    """Upsert products by sku from a CSV or NDJSON file."""
+    with open(path, "rb") as fh:
+        report = import_products(fh, detect_format(fmt, path), batch_size=batch_size)
+    for error in report["errors"]:
+        click.echo(f"line {error['line']} ({error['sku']}): {error['error']}")
+    click.echo(
+        f"done: {report['created']} created, {report['updated']} updated, "
+        f"{report['failed']} failed in {report['seconds']}s "
+        f"({report['rows_per_second']} rows/s)"
+    )
+
+
+@app.cli.command("benchmark-serializers")
+@click.option("--rows", default=500, show_default=True)
+@click.option("--rounds", default=20, show_default=True)
+def benchmark_serializers_command(rows, rounds):
+    """Compare to_dict() with the compiled serializers on existing rows."""
+    for mapper in sorted(db.Model.registry.mappers, key=lambda m: m.class_.__name__):
+        model = mapper.class_
+        if not issubclass(model, SerializerMixin):
+            continue
+        sample = model.query.limit(rows).all()
+        if not sample:
+            click.echo(f"{model.__name__:<14} no rows")
+            continue
+        baseline, compiled = benchmark(model, sample, rounds)
+        click.echo(
+            f"{model.__name__:<14} {len(sample):>5} rows  to_dict {baseline:.4f}s  "
+            f"compiled {compiled:.4f}s  x{baseline / compiled:.1f}"
+        )
+
+
+@app.cli.command("benchmark-stock")
+@click.argument("product_id", type=int)
+@click.option("--stock", default=50, show_default=True)
+@click.option("--checkouts", default=500, show_default=True)
+@click.option("--concurrency", default=64, show_default=True)
+@click.option("--quantity", default=1, show_default=True)
+def benchmark_stock_command(product_id, stock, checkouts, concurrency, quantity):
+    """Race concurrent checkouts on one product and check for oversell."""
+    result = stock_contention_benchmark(
+        product_id, stock, checkouts, concurrency, quantity
+    )
+    for key, value in result.items():
+        click.echo(f"{key:<12} {value}")
+    if result["oversold"] or not result["consistent"]:
+        raise click.ClickException("stock oversold or inconsistent with the log")
+
+
+@app.cli.command("sweep-assets")
+@click.option("--batch-size", default=100, show_default=True)
+@click.option("--grace", default=None, type=int, help="Seconds; default config.")
+def sweep_assets_command(batch_size, grace):
+    """Remove every unreferenced asset, batch_size assets per transaction."""
+    total = 0
+    while True:
+        removed = sweep_assets(batch_size=batch_size, grace=grace)
+        total += removed
+        if removed < batch_size:
+            break
+    staged = sweep_staged_uploads(grace=grace)
+    click.echo(f"done: {total} assets and {staged} staged uploads removed")
+
+
+@app.cli.command("sweep-untracked-assets")
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option("--delete", is_flag=True, help="Remove the files instead of listing.")
+def sweep_untracked_assets_command(batch_size, delete):
+    """List (or delete) upload files nothing in the database refers to."""
+    names = list(untracked_files(batch_size))
+    for name in names:
+        click.echo(name)
+        if delete:
+            os.remove(os.path.join(app.config["UPLOAD_DIR"], name))
+    click.echo(f"{'removed' if delete else 'found'} {len(names)} untracked files")
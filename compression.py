@@ -0,0 +1,67 @@
+# compression.py
+import gzip
+
+from flask import g, request
+
+from cache import CONTENT_ENCODINGS, get_cache
+from config import app
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def _compress(encoding, body):
+    if encoding == "br":
+        return brotli.compress(body, quality=app.config["BROTLI_QUALITY"])
+    return gzip.compress(body, compresslevel=app.config["GZIP_LEVEL"], mtime=0)
+
+
+def _negotiate():
+    offered = [e for e in CONTENT_ENCODINGS if e != "br" or brotli is not None]
+    return request.accept_encodings.best_match(offered)
+
+
+def compress_response(response):
+    """Gzip or brotli encode large text responses the client accepts.
+
+    Bodies served by cached_json keep their compressed variants in the cache
+    next to the plain bytes, so repeat hits skip compression as well.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _negotiate()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < app.config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    cache_key = g.get("cache_key")
+    compressed = None
+    if cache_key:
+        cache = get_cache()
+        compressed = cache.get(f"{cache_key}|{encoding}")
+    if compressed is None:
+        compressed = _compress(encoding, body)
+        if cache_key:
+            cache.set(f"{cache_key}|{encoding}", compressed, g.cache_ttl)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # A strong ETag must differ between encodings of the same resource
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
@@ -1,5 +1,6 @@
 # config.py
 import os
+import tempfile
 
 from dotenv import load_dotenv
 from flask import Flask
@@ -10,6 +11,7 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import MetaData
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
+from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import timedelta
 
 # Load environment variables
@@ -22,7 +24,41 @@ app.secret_key = os.environ.get("SECRET_KEY")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DB_URL")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(weeks=5215)
+# Per-worker front of the shared revocation table (see auth.py)
+app.config["REVOCATION_BLOOM_CAPACITY"] = int(
+    os.getenv("REVOCATION_BLOOM_CAPACITY", 100000)
+)
+app.config["REVOCATION_BLOOM_ERROR_RATE"] = 0.001
+app.config["REVOCATION_LRU_SIZE"] = int(os.getenv("REVOCATION_LRU_SIZE", 4096))
+# How often a worker checks for logouts made by other workers
+app.config["REVOCATION_SYNC_INTERVAL"] = float(
+    os.getenv("REVOCATION_SYNC_INTERVAL", 1)
+)  # seconds
+app.config["REVOCATION_PURGE_INTERVAL"] = int(
+    os.getenv("REVOCATION_PURGE_INTERVAL", 3600)
+)  # seconds
 app.config["JWT_SECRET_KEY"] = os.environ.get("SECRET_KEY")
+# Werkzeug hash method in full, e.g. "pbkdf2:sha256:1000000"; older hashes
+# are upgraded on the next successful login
+app.config["PASSWORD_HASH_METHOD"] = os.getenv(
+    "PASSWORD_HASH_METHOD", "scrypt:32768:8:1"
+)
+# Hashing processes per app worker, so a host runs gunicorn workers (WEB_CONCURRENCY)
+# times this many; the default splits the CPUs between the workers. 0 hashes
+# inline in the request thread
+app.config["PASSWORD_HASH_WORKERS"] = int(
+    os.getenv(
+        "PASSWORD_HASH_WORKERS",
+        max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", 1))),
+    )
+)
+app.config["PASSWORD_HASH_QUEUE"] = int(os.getenv("PASSWORD_HASH_QUEUE", 8))
+app.config["PASSWORD_HASH_TIMEOUT"] = float(
+    os.getenv("PASSWORD_HASH_TIMEOUT", 2)
+)  # seconds, queueing included
+app.config["PASSWORD_HASH_RETRY_AFTER"] = 2  # seconds
+# Let flask-restful pass revoked/expired token errors on to the JWT 401 handlers
+app.config["PROPAGATE_EXCEPTIONS"] = True
 app.config["MAIL_SERVER"] = "smtp.googlemail.com"
 app.config["MAIL_PORT"] = 587
 app.config["MAIL_USERNAME"] = os.getenv("MAIL_USERNAME")
@@ -37,9 +73,85 @@ app.config["ALLOWED_EXTENSIONS"] = {
     "webp",
 }  # Permitted image formats
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024
+app.config["IMPORT_MAX_CONTENT_LENGTH"] = 512 * 1024 * 1024  # bulk catalog files
+app.config["IMPORT_BATCH_SIZE"] = int(os.getenv("IMPORT_BATCH_SIZE", 2000))
+app.config["IMPORT_MAX_ERRORS"] = int(os.getenv("IMPORT_MAX_ERRORS", 1000))
+app.config["EXPORT_BATCH_SIZE"] = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+app.config["BULK_UPDATE_CHUNK_SIZE"] = int(os.getenv("BULK_UPDATE_CHUNK_SIZE", 5000))
+# Unpaid M-Pesa orders hold their stock this long before it is released
+app.config["STOCK_HOLD_TTL"] = int(os.getenv("STOCK_HOLD_TTL", 900))  # seconds
+app.config["STOCK_HOLD_SWEEP_INTERVAL"] = int(
+    os.getenv("STOCK_HOLD_SWEEP_INTERVAL", 30)
+)  # seconds
+app.config["STOCK_HOLD_SWEEP_BATCH"] = int(os.getenv("STOCK_HOLD_SWEEP_BATCH", 500))
+# Idempotency-Key responses are kept this long (seconds)
+app.config["IDEMPOTENCY_TTL"] = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+# How long a retry waits for the first attempt, and when that attempt is
+# considered dead and may be taken over (seconds)
+app.config["IDEMPOTENCY_WAIT_TIMEOUT"] = float(
+    os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 10)
+)
+app.config["IDEMPOTENCY_LOCK_TIMEOUT"] = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", 60))
+app.config["IDEMPOTENCY_PURGE_INTERVAL"] = int(
+    os.getenv("IDEMPOTENCY_PURGE_INTERVAL", 3600)
+)  # seconds
+app.config["IDEMPOTENCY_PURGE_BATCH"] = int(os.getenv("IDEMPOTENCY_PURGE_BATCH", 1000))
+app.config["UPLOAD_TMP_DIR"] = os.getenv(
+    "UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "autospares-uploads")
+)  # Uploads wait here until the image workers have processed them
+app.config["IMAGE_WORKERS"] = int(os.getenv("IMAGE_WORKERS", 2))
+app.config["IMAGE_FORMAT"] = os.getenv("IMAGE_FORMAT", "webp")  # webp or jpeg
+app.config["IMAGE_QUALITY"] = int(os.getenv("IMAGE_QUALITY", 80))
+# Images still unprocessed after this long lost their job and are marked failed
+app.config["IMAGE_PENDING_TIMEOUT"] = int(
+    os.getenv("IMAGE_PENDING_TIMEOUT", 900)
+)  # seconds
+# Public base of the URLs stored for uploaded images (a CDN or proxy works too)
+app.config["ASSET_BASE_URL"] = os.getenv(
+    "ASSET_BASE_URL", "http://54.210.214.53/assets"
+)
+# "x-accel" (nginx) or "x-sendfile" hands file delivery to the front proxy
+app.config["ASSET_OFFLOAD"] = os.getenv("ASSET_OFFLOAD", "")
+app.config["ASSET_ACCEL_PREFIX"] = os.getenv("ASSET_ACCEL_PREFIX", "/protected-assets/")
+app.config["ASSET_MAX_AGE"] = int(os.getenv("ASSET_MAX_AGE", 86400))  # seconds
+app.config["USE_X_SENDFILE"] = app.config["ASSET_OFFLOAD"] == "x-sendfile"
+app.config["ASSET_GC_INTERVAL"] = int(os.getenv("ASSET_GC_INTERVAL", 600))  # seconds
+app.config["ASSET_GC_BATCH"] = int(os.getenv("ASSET_GC_BATCH", 100))
+# Unreferenced assets and staged uploads are kept this long before removal
+app.config["ASSET_GC_GRACE"] = int(os.getenv("ASSET_GC_GRACE", 3600))  # seconds
+app.config["SCHEDULER_ENABLED"] = os.getenv("SCHEDULER_ENABLED", "true") == "true"
+# The gunicorn worker holding this lock is the one that runs the scheduler
+app.config["SCHEDULER_LOCK_FILE"] = os.getenv(
+    "SCHEDULER_LOCK_FILE",
+    os.path.join(tempfile.gettempdir(), "autospares-scheduler.lock"),
+)
 app.config["MAIL_USE_TLS"] = True
 app.config["MAIL_USE_SSL"] = False
-app.json.compact = False
+app.config["MAX_PAGE_SIZE"] = int(os.getenv("MAX_PAGE_SIZE", 100))
+app.config["COUNT_CACHE_TTL"] = int(os.getenv("COUNT_CACHE_TTL", 60))  # seconds
+# Tables estimated below this many rows get a (cached) exact count instead
+app.config["ESTIMATED_COUNT_THRESHOLD"] = int(
+    os.getenv("ESTIMATED_COUNT_THRESHOLD", 10000)
+)
+# Width of the price histogram buckets returned with product facets
+app.config["PRICE_BUCKET_WIDTH"] = float(os.getenv("PRICE_BUCKET_WIDTH", 1000))
+app.config["PRICE_BUCKET_MIN_WIDTH"] = float(os.getenv("PRICE_BUCKET_MIN_WIDTH", 10))
+# Higher prices share the last, open-ended bucket
+app.config["PRICE_BUCKET_MAX"] = int(os.getenv("PRICE_BUCKET_MAX", 50))
+# Listing result cache: "memory" (per process, so single-worker only),
+# "filesystem" (shared) or "tiered"
+app.config["CACHE_BACKEND"] = os.getenv("CACHE_BACKEND", "tiered")
+app.config["CACHE_DIR"] = os.getenv(
+    "CACHE_DIR", os.path.join(tempfile.gettempdir(), "autospares-cache")
+)
+app.config["CACHE_MAX_ENTRIES"] = int(os.getenv("CACHE_MAX_ENTRIES", 512))
+app.config["CACHE_TTL"] = int(os.getenv("CACHE_TTL", 300))  # seconds
+app.config["CACHE_MEMORY_TTL"] = int(os.getenv("CACHE_MEMORY_TTL", 30))
+app.config["CACHE_LOCK_TIMEOUT"] = float(os.getenv("CACHE_LOCK_TIMEOUT", 5))
+app.config["COMPRESS_MIN_SIZE"] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))  # bytes
+app.config["GZIP_LEVEL"] = int(os.getenv("GZIP_LEVEL", 6))
+app.config["BROTLI_QUALITY"] = int(os.getenv("BROTLI_QUALITY", 5))
+app.json.compact = True
 metadata = MetaData(
     naming_convention={
         "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
@@ -49,11 +161,12 @@ metadata = MetaData(
 # Initialize database and migration
 db = SQLAlchemy(metadata=metadata)
 db.init_app(app)
-blacklist = set()
 jwt = JWTManager()
 jwt.init_app(app)
 
 api = Api(app)
 mail = Mail(app)
 migrate = Migrate(app, db)
+# Background jobs register here; app.start_scheduler starts it in one process
+scheduler = BackgroundScheduler(daemon=True)
 CORS(app)
@@ -0,0 +1,208 @@
+# fitment.py
+import json
+import re
+
+from sqlalchemy import delete, event, insert, or_, select
+
+from config import db
+from models import Product, ProductFitment
+
+YEAR_RANGE = re.compile(
+    r"\(?\s*((?:19|20)\d{2})\s*(?:(-|–|to)\s*((?:19|20)\d{2})?)?\s*\)?"
+)
+_fitment_table = ProductFitment.__table__
+
+
+def _entries(raw):
+    """Decode a compatible_* field: JSON list, scalar or object, or CSV text.
+
+    Returns dicts and stripped strings; a bare JSON value such as 2014 counts
+    as a one-entry list and null as none.
+    """
+    if raw is None:
+        return []
+    if not isinstance(raw, str):
+        value = raw
+    else:
+        raw = raw.strip()
+        if not raw:
+            return []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.split(",")
+    if not isinstance(value, list):
+        value = [value]
+    entries = []
+    for entry in value:
+        if not isinstance(entry, dict):
+            entry = _text(entry)
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def _split_years(text):
+    """Return (name, year_from, year_to) for strings like 'Corolla 2010-2015'."""
+    match = YEAR_RANGE.search(text)
+    if not match:
+        return text.strip(), None, None
+    name = (text[: match.start()] + text[match.end() :]).strip()
+    year_from = int(match.group(1))
+    if match.group(3):
+        year_to = int(match.group(3))
+    elif match.group(2):
+        year_to = None  # "2012-" is open ended
+    else:
+        year_to = year_from
+    return name, year_from, year_to
+
+
+def _year(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_fitments(compatible_makes, compatible_models):
+    """Turn a product's free-text compatibility fields into fitment rows.
+
+    Model entries may be plain names ("Corolla"), carry a year range
+    ("Toyota Corolla 2010-2015") or be objects with make/model/year_from/year_to.
+    Plain names are paired with the make they start with, the only make listed,
+    or every listed make when ambiguous. Makes without any model fit all models.
+    """
+    makes = []
+    for entry in _entries(compatible_makes):
+        name = _text(entry.get("make") if isinstance(entry, dict) else entry)
+        if name and name.lower() not in makes:
+            makes.append(name.lower())
+
+    rows = set()
+    covered = set()
+    for entry in _entries(compatible_models):
+        if isinstance(entry, dict):
+            make = _text(entry.get("make")).lower()
+            model = _text(entry.get("model")).lower() or None
+            year_from = _year(entry.get("year_from"))
+            year_to = _year(entry.get("year_to"))
+            candidates = [make] if make else makes
+        else:
+            name, year_from, year_to = _split_years(entry)
+            model = name.lower() or None
+            candidates = makes
+            for make in makes:
+                if model and model.startswith(make + " "):
+                    candidates, model = [make], model[len(make) + 1 :].strip()
+                    break
+        for make in candidates:
+            rows.add((make, model, year_from, year_to))
+            covered.add(make)
+
+    for make in makes:
+        if make not in covered:
+            rows.add((make, None, None, None))
+    return [
+        {"make": make, "model": model, "year_from": year_from, "year_to": year_to}
+        for make, model, year_from, year_to in sorted(rows, key=str)
+    ]
+
+
+def _replace_fitments(connection, product_ids, sources):
+    connection.execute(
+        delete(_fitment_table).where(_fitment_table.c.product_id.in_(product_ids))
+    )
+    rows = [
+        {"product_id": product_id, **row}
+        for product_id, makes, models in sources
+        for row in parse_fitments(makes, models)
+    ]
+    if rows:
+        connection.execute(insert(_fitment_table), rows)
+
+
+def refresh_fitments(connection, product_ids):
+    """Re-derive fitments for products written with Core statements."""
+    if not product_ids:
+        return
+    sources = connection.execute(
+        select(Product.id, Product.compatible_makes, Product.compatible_models).where(
+            Product.id.in_(product_ids)
+        )
+    ).all()
+    _replace_fitments(connection, list(product_ids), sources)
+
+
+def fitment_filter(make, model=None, year=None):
+    """Product.id IN (...) clause answering "which parts fit this vehicle"."""
+    fits = select(ProductFitment.product_id).where(
+        ProductFitment.make == make.strip().lower()
+    )
+    if model:
+        fits = fits.where(
+            or_(
+                ProductFitment.model.is_(None),
+                ProductFitment.model == model.strip().lower(),
+            )
+        )
+    if year is not None:
+        fits = fits.where(
+            or_(ProductFitment.year_from.is_(None), ProductFitment.year_from <= year),
+            or_(ProductFitment.year_to.is_(None), ProductFitment.year_to >= year),
+        )
+    return Product.id.in_(fits)
+
+
+def backfill_fitments(batch_size=1000, echo=print):
+    """Rebuild product_fitments for every product, batch_size products at a time."""
+    last_id, total = 0, 0
+    while True:
+        batch = db.session.execute(
+            select(Product.id, Product.compatible_makes, Product.compatible_models)
+            .where(Product.id > last_id)
+            .order_by(Product.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        _replace_fitments(db.session.connection(), [row.id for row in batch], batch)
+        db.session.commit()
+        last_id, total = batch[-1].id, total + len(batch)
+        echo(f"backfilled fitments for {total} products (last id {last_id})")
+    return total
+
+
+@event.listens_for(Product, "after_insert")
+def _fitments_on_insert(mapper, connection, target):
+    _replace_fitments(
+        connection,
+        [target.id],
+        [(target.id, target.compatible_makes, target.compatible_models)],
+    )
+
+
+@event.listens_for(Product, "after_update")
+def _fitments_on_update(mapper, connection, target):
+    state = db.inspect(target)
+    if not (
+        state.attrs.compatible_makes.history.has_changes()
+        or state.attrs.compatible_models.history.has_changes()
+    ):
+        return
+    _replace_fitments(
+        connection,
+        [target.id],
+        [(target.id, target.compatible_makes, target.compatible_models)],
+    )
+
+
+@event.listens_for(Product, "before_delete")
+def _fitments_on_delete(mapper, connection, target):
+    connection.execute(
+        delete(_fitment_table).where(_fitment_table.c.product_id == target.id)
+    )
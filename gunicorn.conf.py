@@ -0,0 +1,18 @@
+# gunicorn.conf.py -- picked up automatically from the working directory
+# Startup work lives outside app.py's import (see app.bootstrap)
+
+
+def on_starting(server):
+    # Once, in the master, before any worker is forked
+    from app import init_database
+    from cache import check_workers
+
+    check_workers(server.cfg.workers)
+    init_database()
+
+
+def post_worker_init(worker):
+    # Every worker tries; only one runs the background jobs at a time
+    from app import start_scheduler
+
+    start_scheduler()
@@ -0,0 +1,209 @@
+# idempotency.py
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import g, jsonify, make_response, request
+from sqlalchemy import delete, select, update
+
+from config import app, db, scheduler
+from models import IdempotencyKey
+from serializers import encode_json
+from utils import dialect_insert
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+_table = IdempotencyKey.__table__
+
+
+def _fingerprint():
+    payload = request.get_json(silent=True)
+    body = encode_json(payload) if payload is not None else request.get_data()
+    return hashlib.sha256(request.path.encode() + b"\n" + body).hexdigest()
+
+
+def _claim(scope, key, fingerprint):
+    """Insert the key as in progress; True if this request now owns it."""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        dialect_insert(_table)
+        .values(
+            scope=scope,
+            key=key,
+            fingerprint=fingerprint,
+            status="in_progress",
+            locked_at=now,
+            expires_at=now + timedelta(seconds=app.config["IDEMPOTENCY_TTL"]),
+        )
+        .on_conflict_do_nothing(index_elements=["scope", "key"])
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _take_over(scope, key, now):
+    """Reclaim a key that expired or whose owner died mid-request."""
+    stale = now - timedelta(seconds=app.config["IDEMPOTENCY_LOCK_TIMEOUT"])
+    result = db.session.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            (IdempotencyKey.expires_at <= now)
+            | (
+                (IdempotencyKey.status == "in_progress")
+                & (IdempotencyKey.locked_at < stale)
+            ),
+        )
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _release(scope, key):
+    db.session.rollback()
+    db.session.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status == "in_progress",
+        )
+    )
+    db.session.commit()
+
+
+def _replay(row):
+    response = app.response_class(
+        row.response_body, status=row.response_status, mimetype="application/json"
+    )
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _error(message, status, retry_after=None):
+    response = make_response(jsonify({"msg": message}), status)
+    if retry_after:
+        response.retry_after = retry_after
+    return response
+
+
+def idempotent(scope):
+    """Make a POST handler safe to retry with an Idempotency-Key header.
+
+    The first request with a key claims it and runs; the handler stores its
+    success response with remember_response() in the same transaction as its
+    writes. Retries with the same key and body get that response back
+    without running the handler again, and a retry that arrives while the
+    first attempt is still running waits for it (up to
+    IDEMPOTENCY_WAIT_TIMEOUT). A failed attempt releases the key. Requests
+    without the header are handled as before.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return fn(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _error(f"{HEADER} is longer than {MAX_KEY_LENGTH}", 400)
+
+            fingerprint = _fingerprint()
+            deadline = time.monotonic() + app.config["IDEMPOTENCY_WAIT_TIMEOUT"]
+            delay = 0.05
+            while not _claim(scope, key, fingerprint):
+                row = db.session.execute(
+                    select(IdempotencyKey).where(
+                        IdempotencyKey.scope == scope, IdempotencyKey.key == key
+                    )
+                ).scalar_one_or_none()
+                db.session.commit()  # end the read so the next poll sees new rows
+                now = datetime.utcnow()
+                if row is None or _take_over(scope, key, now):
+                    continue
+                if row.fingerprint != fingerprint:
+                    return _error(
+                        f"{HEADER} was already used for a different request", 422
+                    )
+                if row.status == "completed":
+                    return _replay(row)
+                if time.monotonic() >= deadline:
+                    return _error(
+                        "A request with this Idempotency-Key is still in progress",
+                        409,
+                        retry_after=1,
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+            g.idempotency = (scope, key)
+            try:
+                response = fn(*args, **kwargs)
+            except Exception:
+                _release(scope, key)
+                raise
+            finally:
+                g.pop("idempotency", None)
+            status = getattr(response, "status_code", None)
+            if status is None or status >= 300:
+                _release(scope, key)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def remember_response(payload, status):
+    """Store the response for the claimed key, in the caller's transaction."""
+    claimed = g.get("idempotency")
+    if claimed is None:
+        return
+    scope, key = claimed
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        .values(
+            status="completed",
+            response_status=status,
+            response_body=encode_json(payload).decode(),
+        )
+    )
+
+
+def purge_idempotency_keys(batch_size=None):
+    """Delete expired keys in batches."""
+    batch_size = batch_size or app.config["IDEMPOTENCY_PURGE_BATCH"]
+    total = 0
+    while True:
+        expired = (
+            select(IdempotencyKey.scope, IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at <= datetime.utcnow())
+            .limit(batch_size)
+        )
+        result = db.session.execute(
+            delete(IdempotencyKey).where(
+                db.tuple_(IdempotencyKey.scope, IdempotencyKey.key).in_(expired)
+            )
+        )
+        db.session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+def _purge_job():
+    with app.app_context():
+        purge_idempotency_keys()
+
+
+def schedule_idempotency_purge():
+    scheduler.add_job(
+        _purge_job,
+        "interval",
+        seconds=app.config["IDEMPOTENCY_PURGE_INTERVAL"],
+        id="purge-idempotency-keys",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
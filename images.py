@@ -0,0 +1,200 @@
+# images.py
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select, update
+from werkzeug.utils import secure_filename
+
+from assets import (
+    IMAGE_VARIANTS,
+    asset_url,
+    remove_variants,
+    variant_filename,
+    variant_urls,
+    write_upload,
+)
+from cache import mark_tables_changed
+from config import app, db, scheduler
+from models import Asset, Product, ProductImage
+
+_SAVE_OPTIONS = {
+    "webp": {"format": "WEBP", "method": 4},
+    "jpeg": {"format": "JPEG", "optimize": True, "progressive": True},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def stage_upload(upload):
+    """Stream an upload to the temp dir and return (path, digest, size).
+
+    Only the header is read here to reject files that are not images; the
+    full decode happens in the worker.
+    """
+    filename = secure_filename(upload.filename)
+    name, _, extension = filename.rpartition(".")
+    if not name or extension.lower() not in app.config["ALLOWED_EXTENSIONS"]:
+        raise ValueError("File type not allowed")
+
+    path, digest, size = write_upload(upload, app.config["UPLOAD_TMP_DIR"])
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+    except (UnidentifiedImageError, OSError):
+        image_format = None
+    if image_format not in ("PNG", "JPEG", "WEBP"):
+        discard_upload(path)
+        raise ValueError(f"{upload.filename} is not a valid image")
+    return path, digest, size
+
+
+def discard_upload(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _executor_instance():
+    # Created lazily so each gunicorn worker gets its own threads after fork
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config["IMAGE_WORKERS"],
+                thread_name_prefix="image-worker",
+            )
+    return _executor
+
+
+def submit_images(jobs):
+    """Queue [(digest, staged path)] once their rows are committed."""
+    executor = _executor_instance()
+    return [executor.submit(process_image, *job) for job in jobs]
+
+
+def _prepare(image):
+    image = ImageOps.exif_transpose(image)
+    if app.config["IMAGE_FORMAT"] == "jpeg" or image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.mode or "transparency" in image.info
+        mode = "RGBA" if has_alpha and app.config["IMAGE_FORMAT"] == "webp" else "RGB"
+        image = image.convert(mode)
+    return image
+
+
+def _save_variant(image, filename):
+    path = os.path.join(app.config["UPLOAD_DIR"], filename)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    image.save(
+        tmp,
+        quality=app.config["IMAGE_QUALITY"],
+        **_SAVE_OPTIONS[app.config["IMAGE_FORMAT"]],
+    )
+    os.replace(tmp, path)
+
+
+def _update_images(digest, values):
+    db.session.execute(
+        update(ProductImage).where(ProductImage.asset_digest == digest).values(values)
+    )
+    mark_tables_changed(db.session, "product_images")
+
+
+def process_image(digest, path):
+    """Decode a staged upload and write the resized variants of its asset.
+
+    Every ProductImage holding the digest gets each variant's URL as soon as
+    it is written, and the asset is marked ready (or failed) at the end. The
+    staged file is always removed.
+    """
+    with app.app_context():
+        try:
+            with Image.open(path) as source:
+                # Lets the JPEG decoder scale down by up to 8x while decoding
+                source.draft("RGB", IMAGE_VARIANTS[0][1])
+                source.load()
+                image = _prepare(source)
+
+            for variant, size in IMAGE_VARIANTS:
+                image.thumbnail(size, Image.Resampling.LANCZOS)
+                filename = variant_filename(digest, variant)
+                _save_variant(image, filename)
+                _update_images(digest, {f"{variant}_url": asset_url(filename)})
+                db.session.commit()
+            _update_images(digest, {"status": "ready"})
+            db.session.execute(
+                update(Asset).where(Asset.digest == digest).values(status="ready")
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning("asset %s failed processing: %s", digest, e)
+            _mark_failed(digest)
+            db.session.commit()
+        finally:
+            discard_upload(path)
+
+
+def _mark_failed(digest):
+    remove_variants(digest)
+    _update_images(
+        digest,
+        {"status": "failed", **{key: None for key in variant_urls(digest)}},
+    )
+    db.session.execute(
+        update(Asset).where(Asset.digest == digest).values(status="failed")
+    )
+    # Products were listed with the variant that now will never be written
+    db.session.execute(
+        update(Product)
+        .where(Product.imgUrl == asset_url(variant_filename(digest, "listing")))
+        .values(imgUrl="")
+    )
+    mark_tables_changed(db.session, "products")
+
+
+def fail_stale_images(timeout=None):
+    """Mark images still pending after timeout seconds as failed.
+
+    Jobs are queued in the memory of the worker that took the upload, so
+    those still queued when it exits are lost. Uploading the image again
+    processes it anew.
+    """
+    timeout = app.config["IMAGE_PENDING_TIMEOUT"] if timeout is None else timeout
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    digests = db.session.scalars(
+        select(ProductImage.asset_digest)
+        .where(
+            ProductImage.status == "pending",
+            ProductImage.created_at < cutoff,
+            ProductImage.asset_digest.is_not(None),
+        )
+        .distinct()
+    ).all()
+    for digest in digests:
+        app.logger.warning("asset %s was never processed", digest)
+        _mark_failed(digest)
+    db.session.commit()
+    return len(digests)
+
+
+def _recovery_job():
+    with app.app_context():
+        fail_stale_images()
+
+
+def schedule_image_recovery():
+    scheduler.add_job(
+        _recovery_job,
+        "interval",
+        seconds=app.config["ASSET_GC_INTERVAL"],
+        id="fail-stale-images",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
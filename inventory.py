@@ -0,0 +1,352 @@
+# inventory.py
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+
+from cache import mark_tables_changed
+from config import app, db, scheduler
+from models import InventoryLog, OrderItem, Product, StockHold
+
+
+class InsufficientStock(ValueError):
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(
+            "Insufficient stock for Product ID "
+            + ", ".join(str(line["product_id"]) for line in shortfalls)
+            + "."
+        )
+
+
+PAID_STATUSES = ("paid", "completed")
+CANCELLED_STATUSES = ("cancelled", "canceled", "failed")
+
+
+def _shortfalls(quantities, taken=()):
+    """Short lines of the order, judged on stock before this order took any.
+
+    Lines in `taken` were already decremented in this transaction, so their
+    quantities are added back to what the database reports.
+    """
+    available = dict(
+        db.session.execute(
+            select(Product.id, Product.available_stock).where(
+                Product.id.in_(list(quantities))
+            )
+        ).all()
+    )
+    for product_id in taken:
+        available[product_id] += quantities[product_id]
+    return [
+        {
+            "product_id": product_id,
+            "requested": quantity,
+            "available": max(available.get(product_id) or 0, 0),
+            "short": quantity - max(available.get(product_id) or 0, 0),
+        }
+        for product_id, quantity in sorted(quantities.items())
+        if (available.get(product_id) or 0) < quantity
+    ]
+
+
+def _quantities(lines):
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return quantities
+
+
+def _take(quantities, values):
+    """Conditionally update each product's row; returns {product_id: new stock}.
+
+    Each product gets one UPDATE ... WHERE stock - reserved >= quantity,
+    issued in product id order so concurrent checkouts lock rows in the same
+    order and cannot deadlock. A row without enough available stock simply
+    matches nothing, so it can never be oversold however many checkouts
+    race for it.
+    """
+    table = Product.__table__
+    taken = {}
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        new_stock = db.session.execute(
+            update(table)
+            .where(
+                table.c.id == product_id,
+                table.c.stock - table.c.reserved >= quantity,
+            )
+            .values(values(table, quantity))
+            .returning(table.c.stock)
+        ).scalar()
+        if new_stock is None:
+            # Report every short line, not just the first one
+            raise InsufficientStock(_shortfalls(quantities, taken))
+        taken[product_id] = new_stock
+    mark_tables_changed(db.session, "products")
+    return taken
+
+
+def _log_sales(quantities, new_stock, change_type, reference_id, created_by):
+    logs = [
+        {
+            "product_id": product_id,
+            "quantity_change": -quantity,
+            "previous_stock": new_stock[product_id] + quantity,
+            "new_stock": new_stock[product_id],
+            "change_type": change_type,
+            "reference_id": reference_id,
+            "created_by": created_by,
+        }
+        for product_id, quantity in sorted(quantities.items())
+    ]
+    if logs:
+        db.session.execute(insert(InventoryLog), logs)
+        mark_tables_changed(db.session, "inventory_logs")
+    return logs
+
+
+def reserve_stock(lines, change_type="sale", reference_id=None, created_by=None):
+    """Decrement stock for [(product_id, quantity)] or raise InsufficientStock.
+
+    Only stock not held for other orders can be taken. The InventoryLog rows
+    are inserted in the same transaction. Call this last before committing:
+    the row locks are held until then. On InsufficientStock the caller must
+    roll back.
+    """
+    quantities = _quantities(lines)
+    new_stock = _take(
+        quantities, lambda table, quantity: {"stock": table.c.stock - quantity}
+    )
+    return _log_sales(quantities, new_stock, change_type, reference_id, created_by)
+
+
+def hold_stock(lines, order_id, ttl=None):
+    """Hold [(product_id, quantity)] for an unpaid order or raise InsufficientStock.
+
+    Held units stay in stock but leave available_stock until the hold is
+    settled, released or expires after ttl seconds (STOCK_HOLD_TTL).
+    """
+    quantities = _quantities(lines)
+    _take(
+        quantities,
+        lambda table, quantity: {"reserved": table.c.reserved + quantity},
+    )
+    ttl = app.config["STOCK_HOLD_TTL"] if ttl is None else ttl
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    holds = [
+        {
+            "order_id": order_id,
+            "product_id": product_id,
+            "quantity": quantity,
+            "expires_at": expires_at,
+        }
+        for product_id, quantity in sorted(quantities.items())
+    ]
+    db.session.execute(insert(StockHold), holds)
+    mark_tables_changed(db.session, "stock_holds")
+    return holds
+
+
+def _claim_holds(*criteria):
+    """Delete matching holds and return {product_id: quantity} they held.
+
+    Deleting first makes settling, cancelling and expiry race-free: whichever
+    gets a hold row also gets to adjust the product.
+    """
+    claimed = Counter()
+    for product_id, quantity in db.session.execute(
+        delete(StockHold)
+        .where(*criteria)
+        .returning(StockHold.product_id, StockHold.quantity)
+    ):
+        claimed[product_id] += quantity
+    if claimed:
+        mark_tables_changed(db.session, "stock_holds")
+    return claimed
+
+
+def _unreserve(quantities):
+    table = Product.__table__
+    for product_id in sorted(quantities):
+        db.session.execute(
+            update(table)
+            .where(table.c.id == product_id)
+            .values(reserved=table.c.reserved - quantities[product_id])
+        )
+    if quantities:
+        mark_tables_changed(db.session, "products")
+
+
+def release_holds(order_id):
+    """Give an order's held stock back, e.g. when it is cancelled."""
+    claimed = _claim_holds(StockHold.order_id == order_id)
+    _unreserve(claimed)
+    return sum(claimed.values())
+
+
+def allocate_order_stock(order, lines):
+    """Hold stock for an unpaid M-Pesa order; sell it outright otherwise."""
+    if (
+        order.payment_method == "mpesa"
+        and (order.payment_status or "").lower() not in PAID_STATUSES
+    ):
+        order.stock_allocation = "held"
+        return hold_stock(lines, order.id)
+    order.stock_allocation = "sold"
+    return reserve_stock(lines, reference_id=order.order_number)
+
+
+def settle_order_stock(order, created_by=None):
+    """Turn a paid order's holds into sales.
+
+    Orders whose stock was sold outright at checkout, or already settled,
+    are left alone. If the holds expired or were released the stock is taken
+    afresh, which raises InsufficientStock when it has been sold meanwhile.
+    """
+    if order.stock_allocation != "held":
+        return []
+    order.stock_allocation = "sold"
+    claimed = _claim_holds(StockHold.order_id == order.id)
+    if not claimed:
+        lines = db.session.execute(
+            select(OrderItem.product_id, OrderItem.quantity).where(
+                OrderItem.order_id == order.id
+            )
+        ).all()
+        return reserve_stock(
+            lines, reference_id=order.order_number, created_by=created_by
+        )
+    table = Product.__table__
+    new_stock = {}
+    for product_id in sorted(claimed):
+        quantity = claimed[product_id]
+        new_stock[product_id] = db.session.execute(
+            update(table)
+            .where(table.c.id == product_id)
+            .values(
+                stock=table.c.stock - quantity,
+                reserved=table.c.reserved - quantity,
+            )
+            .returning(table.c.stock)
+        ).scalar_one()
+    mark_tables_changed(db.session, "products")
+    return _log_sales(claimed, new_stock, "sale", order.order_number, created_by)
+
+
+def release_expired_holds(batch_size=None):
+    """Release expired holds in batches of the oldest, one transaction each."""
+    batch_size = batch_size or app.config["STOCK_HOLD_SWEEP_BATCH"]
+    released = 0
+    while True:
+        expired = (
+            select(StockHold.id)
+            .where(StockHold.expires_at <= datetime.utcnow())
+            .order_by(StockHold.expires_at)
+            .limit(batch_size)
+        )
+        if db.engine.dialect.name == "postgresql":
+            # Let a second sweeper take the next batch instead of waiting
+            expired = expired.with_for_update(skip_locked=True)
+        claimed = _claim_holds(StockHold.id.in_(expired.scalar_subquery()))
+        _unreserve(claimed)
+        db.session.commit()
+        released += sum(claimed.values())
+        if not claimed:
+            return released
+
+
+def _sweep_job():
+    with app.app_context():
+        release_expired_holds()
+
+
+def schedule_hold_sweeper():
+    scheduler.add_job(
+        _sweep_job,
+        "interval",
+        seconds=app.config["STOCK_HOLD_SWEEP_INTERVAL"],
+        id="release-expired-holds",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
+
+
+def stock_contention_benchmark(product_id, stock, checkouts, concurrency, quantity=1):
+    """Race checkouts for one product and check that none oversold it.
+
+    The product's stock is set to `stock` for the run and restored after,
+    and the benchmark's InventoryLog rows are removed again.
+    """
+    reference = f"benchmark-{uuid.uuid4().hex[:12]}"
+    original = db.session.get(Product, product_id)
+    if original is None:
+        raise ValueError(f"Product ID {product_id} not found.")
+    original_stock = original.stock
+    db.session.execute(
+        update(Product).where(Product.id == product_id).values(stock=stock)
+    )
+    db.session.commit()
+
+    counts = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def checkout(_):
+        with app.app_context():
+            started = time.perf_counter()
+            try:
+                reserve_stock([(product_id, quantity)], reference_id=reference)
+                db.session.commit()
+                outcome = "sold"
+            except InsufficientStock:
+                db.session.rollback()
+                outcome = "rejected"
+            except Exception:
+                db.session.rollback()
+                outcome = "errors"
+            with lock:
+                counts[outcome] += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(checkout, range(checkouts)))
+    elapsed = time.perf_counter() - started
+
+    db.session.expire_all()
+    final_stock = db.session.scalar(
+        select(Product.stock).where(Product.id == product_id)
+    )
+    logged = db.session.scalar(
+        select(func.coalesce(func.sum(-InventoryLog.quantity_change), 0)).where(
+            InventoryLog.reference_id == reference
+        )
+    )
+    db.session.execute(
+        delete(InventoryLog).where(InventoryLog.reference_id == reference)
+    )
+    db.session.execute(
+        update(Product).where(Product.id == product_id).values(stock=original_stock)
+    )
+    db.session.commit()
+
+    latencies.sort()
+    sold_units = counts["sold"] * quantity
+    return {
+        "checkouts": checkouts,
+        "sold": counts["sold"],
+        "rejected": counts["rejected"],
+        "errors": counts["errors"],
+        "final_stock": final_stock,
+        "oversold": max(sold_units - stock, 0) + max(-final_stock, 0),
+        "consistent": final_stock == stock - sold_units and logged == sold_units,
+        "seconds": round(elapsed, 3),
+        "p50": round(latencies[len(latencies) // 2], 4) if latencies else None,
+        "p99": round(latencies[int(len(latencies) * 0.99)], 4) if latencies else None,
+    }
@@ -0,0 +1,74 @@
+"""case-insensitive customer email and address hash indexes
+
+Revision ID: 4d8a1c6e3b92
+Revises: 7e2b9d1f4c86
+Create Date: 2026-10-17 21:14:27.640193
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8a1c6e3b92'
+down_revision = '7e2b9d1f4c86'
+branch_labels = None
+depends_on = None
+
+ADDRESS_FIELDS = ('specific_address', 'area_town', 'county', 'city_town')
+
+
+def _address_hash(row):
+    # Same normalization as Address.hash_fields
+    normalized = (
+        ' '.join(str(row[name] or '').split()).casefold() for name in ADDRESS_FIELDS
+    )
+    return hashlib.sha256('\x1f'.join(normalized).encode()).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('address_hash', sa.String(length=64), nullable=True))
+
+    # Backfill; later duplicates of an address keep a NULL hash so the unique
+    # index can be built, and checkout resolves to the first one
+    bind = op.get_bind()
+    addresses = sa.table(
+        'addresses',
+        sa.column('id', sa.Integer),
+        sa.column('customer_id', sa.Integer),
+        sa.column('address_hash', sa.String),
+        *(sa.column(name, sa.Text) for name in ADDRESS_FIELDS),
+    )
+    seen, updates = set(), []
+    rows = bind.execute(
+        sa.select(addresses).order_by(addresses.c.id)
+    ).mappings()
+    for row in rows:
+        key = (row['customer_id'], _address_hash(row))
+        if key not in seen:
+            seen.add(key)
+            updates.append({'b_id': row['id'], 'b_hash': key[1]})
+    if updates:
+        bind.execute(
+            addresses.update()
+            .where(addresses.c.id == sa.bindparam('b_id'))
+            .values(address_hash=sa.bindparam('b_hash')),
+            updates,
+        )
+
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.create_index('ix_addresses_customer_id_address_hash', ['customer_id', 'address_hash'], unique=True)
+
+    # Fails if customers already differ only by email case; merge those first
+    op.create_index('ix_customers_email_lower', 'customers', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_customers_email_lower', table_name='customers')
+
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.drop_index('ix_addresses_customer_id_address_hash')
+        batch_op.drop_column('address_hash')
@@ -0,0 +1,57 @@
+"""product full text search index
+
+Revision ID: 8e3d52b0c4a7
+Revises: 5c1f0e7a9b21
+Create Date: 2026-10-17 10:04:17.553902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3d52b0c4a7'
+down_revision = '5c1f0e7a9b21'
+branch_labels = None
+depends_on = None
+
+SEARCH_FIELDS = (
+    ('name', 'A'),
+    ('sku', 'A'),
+    ('compatible_makes', 'B'),
+    ('compatible_models', 'B'),
+    ('features', 'C'),
+    ('description', 'D'),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = ', '.join(field for field, _ in SEARCH_FIELDS)
+    if bind.dialect.name == 'postgresql':
+        vector = ' || '.join(
+            f"setweight(to_tsvector('simple', coalesce({field}, '')), '{weight}')"
+            for field, weight in SEARCH_FIELDS
+        )
+        op.execute(
+            'ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            f'GENERATED ALWAYS AS ({vector}) STORED'
+        )
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_products_search_vector '
+            'ON products USING gin (search_vector)'
+        )
+    elif bind.dialect.name == 'sqlite':
+        op.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5({columns})')
+        op.execute(
+            f'INSERT INTO products_fts(rowid, {columns}) SELECT id, {columns} FROM products'
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_products_search_vector')
+        op.execute('ALTER TABLE products DROP COLUMN IF EXISTS search_vector')
+    elif bind.dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS products_fts')
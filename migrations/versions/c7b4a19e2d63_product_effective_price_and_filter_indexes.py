@@ -0,0 +1,39 @@
+"""product effective price and listing filter indexes
+
+Revision ID: c7b4a19e2d63
+Revises: 2a9f6c3d1e58
+Create Date: 2026-10-17 12:47:55.106218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7b4a19e2d63'
+down_revision = '2a9f6c3d1e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite cannot ALTER TABLE ADD a stored generated column, so copy the table
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    with op.batch_alter_table('products', schema=None, recreate=recreate) as batch_op:
+        batch_op.add_column(sa.Column('effective_price', sa.Float(), sa.Computed('price * (1 - coalesce(discount, 0) / 100.0)', persisted=True), nullable=True))
+        batch_op.create_index('ix_products_price_id', ['price', 'id'], unique=False)
+        batch_op.create_index('ix_products_effective_price_id', ['effective_price', 'id'], unique=False)
+        batch_op.create_index('ix_products_category_id_price', ['category_id', 'price'], unique=False)
+        batch_op.create_index('ix_products_brand_id_price', ['brand_id', 'price'], unique=False)
+        batch_op.create_index('ix_products_status_is_featured', ['status', 'is_featured'], unique=False)
+
+
+def downgrade():
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    with op.batch_alter_table('products', schema=None, recreate=recreate) as batch_op:
+        batch_op.drop_index('ix_products_status_is_featured')
+        batch_op.drop_index('ix_products_brand_id_price')
+        batch_op.drop_index('ix_products_category_id_price')
+        batch_op.drop_index('ix_products_effective_price_id')
+        batch_op.drop_index('ix_products_price_id')
+        batch_op.drop_column('effective_price')
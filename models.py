@@ -1,12 +1,28 @@
 # models.py
+import hashlib
 from datetime import datetime
 from config import db
+from passwords import (
+    PasswordHashingBusy,
+    hash_password,
+    needs_rehash,
+    verify_password,
+)
+from sqlalchemy import event, func
 from sqlalchemy_serializer import SerializerMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 
 
 class Address(db.Model, SerializerMixin):
     __tablename__ = "addresses"
+    __table_args__ = (
+        # One row per distinct address of a customer (see address_hash)
+        db.Index(
+            "ix_addresses_customer_id_address_hash",
+            "customer_id",
+            "address_hash",
+            unique=True,
+        ),
+    )
     serialize_only = (
         "id",
         "customer_id",
@@ -27,6 +43,7 @@ class Address(db.Model, SerializerMixin):
     city_town = db.Column(
         db.Text, nullable=False
     )  # Added city_town as per new requirements
+    address_hash = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     shipping_orders = db.relationship(
@@ -36,6 +53,25 @@ class Address(db.Model, SerializerMixin):
         "Order", foreign_keys="Order.billing_address_id", backref="billing_address"
     )
 
+    HASHED_FIELDS = ("specific_address", "area_town", "county", "city_town")
+
+    @staticmethod
+    def hash_fields(fields):
+        """sha256 of the address fields, ignoring case and spacing differences."""
+        normalized = (
+            " ".join(str(fields.get(name) or "").split()).casefold()
+            for name in Address.HASHED_FIELDS
+        )
+        return hashlib.sha256("\x1f".join(normalized).encode()).hexdigest()
+
+
+@event.listens_for(Address, "before_insert")
+@event.listens_for(Address, "before_update")
+def _set_address_hash(mapper, connection, target):
+    target.address_hash = Address.hash_fields(
+        {name: getattr(target, name) for name in Address.HASHED_FIELDS}
+    )
+
 
 class Category(db.Model, SerializerMixin):
     __tablename__ = "categories"
@@ -61,6 +97,26 @@ class Category(db.Model, SerializerMixin):
     products = db.relationship("Product", backref="category")
 
 
+# Every (ancestor, descendant) pair of the category tree, including (id, id, 0)
+class CategoryClosure(db.Model):
+    __tablename__ = "category_closure"
+    __table_args__ = (
+        db.Index("ix_category_closure_descendant_id", "descendant_id", "depth"),
+    )
+
+    ancestor_id = db.Column(
+        db.Integer,
+        db.ForeignKey("categories.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    descendant_id = db.Column(
+        db.Integer,
+        db.ForeignKey("categories.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    depth = db.Column(db.Integer, nullable=False)
+
+
 class Brand(db.Model, SerializerMixin):
     __tablename__ = "brands"
     serialize_only = (
@@ -90,6 +146,16 @@ class Brand(db.Model, SerializerMixin):
 
 class Product(db.Model, SerializerMixin):
     __tablename__ = "products"
+    __table_args__ = (
+        # Keyset pagination seeks on (created_at, id)
+        db.Index("ix_products_created_at_id", "created_at", "id"),
+        # Listing filters / sorts
+        db.Index("ix_products_price_id", "price", "id"),
+        db.Index("ix_products_effective_price_id", "effective_price", "id"),
+        db.Index("ix_products_category_id_price", "category_id", "price"),
+        db.Index("ix_products_brand_id_price", "brand_id", "price"),
+        db.Index("ix_products_status_is_featured", "status", "is_featured"),
+    )
     serialize_only = (
         "id",
         "name",
@@ -102,6 +168,7 @@ class Product(db.Model, SerializerMixin):
         "category_id",
         "brand_id",
         "stock",
+        "available_stock",
         "weight",
         "dimensions",
         "features",
@@ -118,18 +185,28 @@ class Product(db.Model, SerializerMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     name = db.Column(db.Text, nullable=False)
     sku = db.Column(db.Text, unique=True, nullable=False)
-    description = db.Column(db.Text, nullable=False)
+    # Heavy text is deferred; listings load it explicitly (see serializers.py)
+    description = db.deferred(db.Column(db.Text, nullable=False), group="heavy")
     imgUrl = db.Column(db.Text, nullable=False)
     price = db.Column(db.Float, nullable=False)
     cost = db.Column(db.Float)
-    discount = db.Column(db.Float)
+    discount = db.Column(db.Float)  # percentage off price
+    effective_price = db.Column(
+        db.Float,
+        db.Computed("price * (1 - coalesce(discount, 0) / 100.0)", persisted=True),
+    )
     category_id = db.Column(db.Integer, db.ForeignKey("categories.id"), nullable=False)
     brand_id = db.Column(db.Integer, db.ForeignKey("brands.id"))
     stock = db.Column(db.Integer, nullable=False, default=1)
+    # Units held for unpaid orders (see inventory.py); kept in step with stock_holds
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    available_stock = db.Column(
+        db.Integer, db.Computed("stock - reserved", persisted=True)
+    )
     weight = db.Column(db.Float)
     dimensions = db.Column(db.Text)  # Store as JSON string
     features = db.Column(db.Text)
-    specifications = db.Column(db.Text)
+    specifications = db.deferred(db.Column(db.Text), group="heavy")
     status = db.Column(db.Text, nullable=False, default="Active")
     meta_title = db.Column(db.Text)
     meta_description = db.Column(db.Text)
@@ -137,15 +214,72 @@ class Product(db.Model, SerializerMixin):
     compatible_makes = db.Column(db.Text)  # Store as JSON string
     compatible_models = db.Column(db.Text)  # Store as JSON string
 
-    images = db.relationship("ProductImage", backref="product")
+    images = db.relationship(
+        "ProductImage",
+        backref="product",
+        order_by="ProductImage.id",
+        cascade="all, delete-orphan",
+    )
     order_items = db.relationship("OrderItem", backref="product")
     reviews = db.relationship("Review", backref="product")
     inventory_logs = db.relationship("InventoryLog", backref="product")
 
 
+# Normalized rows parsed from compatible_makes / compatible_models (see fitment.py)
+class ProductFitment(db.Model, SerializerMixin):
+    __tablename__ = "product_fitments"
+    __table_args__ = (
+        db.Index("ix_product_fitments_lookup", "make", "model", "year_from"),
+        db.Index("ix_product_fitments_product_id", "product_id"),
+    )
+    serialize_only = ("id", "product_id", "make", "model", "year_from", "year_to")
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(
+        db.Integer,
+        db.ForeignKey("products.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    make = db.Column(db.Text, nullable=False)  # lower-cased
+    model = db.Column(db.Text)  # lower-cased, NULL fits every model of the make
+    year_from = db.Column(db.Integer)  # NULL means open ended
+    year_to = db.Column(db.Integer)
+
+
+# Stored image content keyed by the SHA-256 of the upload; ProductImage rows
+# holding the digest are the references counted in ref_count
+class Asset(db.Model):
+    __tablename__ = "assets"
+    __table_args__ = (
+        db.Index("ix_assets_ref_count_released_at", "ref_count", "released_at"),
+    )
+
+    digest = db.Column(db.String(64), primary_key=True)
+    status = db.Column(db.Text, nullable=False, default="pending")
+    size = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime)  # when ref_count last dropped to zero
+
+
 class ProductImage(db.Model, SerializerMixin):
     __tablename__ = "product_images"
-    serialize_only = ("id", "product_id", "url", "created_at", "is_primary", "alt_text")
+    __table_args__ = (
+        db.Index("ix_product_images_product_id_is_primary", "product_id", "is_primary"),
+        db.Index("ix_product_images_asset_digest", "asset_digest"),
+    )
+    serialize_only = (
+        "id",
+        "product_id",
+        "url",
+        "created_at",
+        "is_primary",
+        "alt_text",
+        "status",
+        "thumbnail_url",
+        "listing_url",
+        "zoom_url",
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
@@ -153,10 +287,20 @@ class ProductImage(db.Model, SerializerMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_primary = db.Column(db.Boolean, default=False)
     alt_text = db.Column(db.Text)
+    # pending until the image worker has written the resized variants below
+    status = db.Column(db.Text, nullable=False, default="ready", server_default="ready")
+    thumbnail_url = db.Column(db.Text)
+    listing_url = db.Column(db.Text)
+    zoom_url = db.Column(db.Text)
+    asset_digest = db.Column(db.String(64), db.ForeignKey("assets.digest"))
 
 
 class Customer(db.Model, SerializerMixin):
     __tablename__ = "customers"
+    __table_args__ = (
+        # Keyset pagination seeks on (created_at, id)
+        db.Index("ix_customers_created_at_id", "created_at", "id"),
+    )
     serialize_only = (
         "id",
         "first_name",
@@ -180,8 +324,17 @@ class Customer(db.Model, SerializerMixin):
     reviews = db.relationship("Review", backref="customer")
 
 
+# Emails match case-insensitively; checkout upserts on this index
+db.Index("ix_customers_email_lower", func.lower(Customer.email), unique=True)
+
+
 class Order(db.Model, SerializerMixin):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Keyset pagination seeks on (created_at, id)
+        db.Index("ix_orders_created_at_id", "created_at", "id"),
+        db.Index("ix_orders_tracking_number", "tracking_number", unique=True),
+    )
     serialize_only = (
         "id",
         "customer_id",
@@ -225,6 +378,8 @@ class Order(db.Model, SerializerMixin):
     tracking_number = db.Column(db.Text)
     delivery_person = db.Column(db.Text)
     estimated_delivery_date = db.Column(db.DateTime)
+    # "held" while the order's stock waits on payment, "sold" once it is taken
+    stock_allocation = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -302,6 +457,22 @@ class InventoryLog(db.Model, SerializerMixin):
     created_by = db.Column(db.Integer, db.ForeignKey("users.id"))
 
 
+# Stock held for an unpaid order until it is paid, cancelled or expires
+class StockHold(db.Model):
+    __tablename__ = "stock_holds"
+    __table_args__ = (
+        db.Index("ix_stock_holds_expires_at", "expires_at"),
+        db.Index("ix_stock_holds_order_id", "order_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey("orders.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Role(db.Model, SerializerMixin):
     __tablename__ = "roles"
     serialize_only = ("id", "name", "level")
@@ -340,7 +511,45 @@ class User(db.Model, SerializerMixin):
     role_id = db.Column(db.Integer, db.ForeignKey("roles.id"))
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading a hash made with outdated parameters.
+
+        The upgraded hash is only set on the instance; the caller commits it.
+        """
+        valid = verify_password(self.password_hash, password)
+        if valid and needs_rehash(self.password_hash):
+            try:
+                self.password_hash = hash_password(password, operation="rehash")
+            except PasswordHashingBusy:
+                pass  # keep the old hash; try again on a later login
+        return valid
+
+
+# Logged out access tokens, kept until the token itself would have expired
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        db.Index("ix_revoked_tokens_expires_at", "expires_at"),
+        db.Index("ix_revoked_tokens_revoked_at", "revoked_at"),
+    )
+
+    jti = db.Column(db.String(36), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Responses of POSTs made with an Idempotency-Key header, replayed on retry
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (db.Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    scope = db.Column(db.String(64), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Text, nullable=False, default="in_progress")
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    locked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
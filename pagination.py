@@ -0,0 +1,191 @@
+# pagination.py
+import base64
+import binascii
+import json
+import math
+import time
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import text, tuple_
+
+from config import app, db
+from serializers import load_options, serialize_many
+from utils import str_to_bool
+
+# Cached COUNT(*) results keyed by table name / compiled statement
+_count_cache = {}
+COUNT_CACHE_SIZE = 1024
+
+
+class CursorError(ValueError):
+    """Raised when a client supplied cursor cannot be decoded."""
+
+
+def is_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+
+def encode_cursor(sort_name, value, last_id):
+    """Pack the (sort value, id) of the last row into an opaque url-safe token."""
+    payload = {"s": sort_name, "i": last_id}
+    if isinstance(value, datetime):
+        payload["d"] = value.isoformat()
+    else:
+        payload["v"] = value
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_name):
+    """Return the (sort value, id) tuple stored in a cursor for the given sort."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort_name:
+            raise CursorError("Cursor does not match the requested sort order")
+        value = datetime.fromisoformat(payload["d"]) if "d" in payload else payload["v"]
+        return value, int(payload["i"])
+    except CursorError:
+        raise
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise CursorError("Invalid cursor")
+
+
+def _cached(key, compute):
+    ttl = app.config["COUNT_CACHE_TTL"]
+    now = time.monotonic()
+    hit = _count_cache.get(key)
+    if hit and hit[1] > now:
+        return hit[0]
+    value = compute()
+    if len(_count_cache) >= COUNT_CACHE_SIZE:
+        # Filtered listings produce many keys; drop the oldest entry
+        _count_cache.pop(next(iter(_count_cache)))
+    _count_cache[key] = (value, now + ttl)
+    return value
+
+
+def _estimated_rows(model):
+    """Planner row estimate from pg_class, or None when unavailable."""
+    if not is_postgres():
+        return None
+    estimate = db.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+        {"t": model.__tablename__},
+    ).scalar()
+    if estimate is None or estimate < app.config["ESTIMATED_COUNT_THRESHOLD"]:
+        # Never analyzed (-1) or small enough that an exact count is cheap
+        return None
+    return int(estimate)
+
+
+def listing_total(query, model, exact=False, filtered=False):
+    """Return (total, is_exact) for a listing query.
+
+    Exact totals are only computed on request; otherwise unfiltered listings use
+    the planner estimate on Postgres and everything else a short-lived cached count.
+    """
+    count_query = query.order_by(None)
+    if exact:
+        return count_query.count(), True
+    if not filtered:
+        estimate = _estimated_rows(model)
+        if estimate is not None:
+            return estimate, False
+        key = model.__tablename__
+    else:
+        compiled = count_query.statement.compile(dialect=db.engine.dialect)
+        key = (str(compiled), repr(sorted(compiled.params.items(), key=str)))
+    return _cached(key, count_query.count), False
+
+
+def _sort_spec(model, sorts):
+    sorts = sorts or {"id": model.id, "created_at": model.created_at}
+    requested = request.args.get("sort", "id")
+    descending = requested.startswith("-")
+    sort_name = requested.lstrip("-")
+    if sort_name not in sorts:
+        raise ValueError(
+            f"Invalid sort '{sort_name}', expected one of: {', '.join(sorts)}"
+        )
+    column = sorts[sort_name]
+    columns = [model.id] if column is model.id else [column, model.id]
+    return requested, column, columns, descending
+
+
+def paginate_listing(
+    query, model, serialize_page=None, sorts=None, filtered=False, fields=None
+):
+    """Run a listing query in page (?page=) or cursor (?cursor=) mode.
+
+    Cursor mode seeks on the indexed (sort column, id) tuple, so every page costs
+    the same regardless of depth. Both modes skip the COUNT(*) unless the caller
+    passes ?exact_total=1. serialize_page receives the whole page of rows so it
+    can batch-load anything it embeds. With `fields` (see requested_fields) only
+    those columns, plus the sort key, are loaded.
+    """
+    serialize_page = serialize_page or (lambda rows: serialize_many(rows, fields))
+    max_page_size = app.config["MAX_PAGE_SIZE"]
+    exact = str_to_bool(request.args.get("exact_total", False))
+    sort_key, column, columns, descending = _sort_spec(model, sorts)
+    order_by = [c.desc() if descending else c.asc() for c in columns]
+    count_query = query
+    query = query.options(*load_options(model, fields, [c.key for c in columns]))
+
+    if "cursor" in request.args:
+        limit = request.args.get(
+            "limit", request.args.get("per_page", 10, type=int), type=int
+        )
+        limit = max(1, min(limit, max_page_size))
+        cursor = request.args.get("cursor")
+        page_query = query
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort_key)
+            if len(columns) == 1:
+                seek = model.id < last_id if descending else model.id > last_id
+            else:
+                row, key = tuple_(*columns), tuple_(value, last_id)
+                seek = row < key if descending else row > key
+            page_query = page_query.filter(seek)
+        rows = page_query.order_by(*order_by).limit(limit + 1).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        last = rows[-1] if rows else None
+        total, total_exact = listing_total(count_query, model, exact, filtered)
+        return {
+            "content": serialize_page(rows),
+            "next_cursor": (
+                encode_cursor(sort_key, getattr(last, column.key), last.id)
+                if has_next
+                else None
+            ),
+            "limit": limit,
+            "has_next": has_next,
+            "total": total,
+            "total_exact": total_exact,
+        }
+
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = max(1, min(request.args.get("per_page", 10, type=int), max_page_size))
+    rows = (
+        query.order_by(*order_by)
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+        .all()
+    )
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    total, total_exact = listing_total(count_query, model, exact, filtered)
+    # Keep the estimate consistent with what this page has actually seen
+    total = max(total, (page - 1) * per_page + len(rows) + (1 if has_next else 0))
+    return {
+        "content": serialize_page(rows),
+        "total": total,
+        "total_exact": total_exact,
+        "pages": math.ceil(total / per_page),
+        "current_page": page,
+        "per_page": per_page,
+        "has_next": has_next,
+        "has_prev": page > 1,
+    }
@@ -0,0 +1,181 @@
+# passwords.py
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import app
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots_lock = threading.Lock()
+_in_flight = 0
+
+
+class PasswordHashingBusy(ServiceUnavailable):
+    description = "Too many sign-ins in progress, please retry shortly"
+
+
+class HashMetrics:
+    """Per-worker counters and latency histograms for password hashing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operations = {}
+        self.rejected = self.timed_out = 0
+
+    def observe(self, operation, seconds):
+        with self._lock:
+            stats = self.operations.setdefault(
+                operation,
+                {
+                    "count": 0,
+                    "seconds": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                },
+            )
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            bucket = next(
+                (i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+                len(LATENCY_BUCKETS),
+            )
+            stats["buckets"][bucket] += 1
+
+    def reject(self, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timed_out += 1
+            else:
+                self.rejected += 1
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+        with self._lock:
+            operations = {
+                operation: {
+                    "count": stats["count"],
+                    "mean": round(stats["seconds"] / stats["count"], 4),
+                    "max": round(stats["max"], 4),
+                    "buckets": dict(zip(bounds, stats["buckets"])),
+                }
+                for operation, stats in self.operations.items()
+            }
+            return {
+                "pid": os.getpid(),
+                "workers": app.config["PASSWORD_HASH_WORKERS"],
+                "in_flight": _in_flight,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "operations": operations,
+            }
+
+
+metrics = HashMetrics()
+
+
+def _pool():
+    # Created lazily so each gunicorn worker gets its own pool after fork.
+    # Children are spawned, not forked, so they hold none of the parent's
+    # threads or locks. They do re-import __main__, which is why app.py keeps
+    # its startup work in bootstrap() rather than at import.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config["PASSWORD_HASH_WORKERS"],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+
+def _reset_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _acquire_slot():
+    global _in_flight
+    capacity = app.config["PASSWORD_HASH_WORKERS"] + app.config["PASSWORD_HASH_QUEUE"]
+    with _slots_lock:
+        if _in_flight >= capacity:
+            return False
+        _in_flight += 1
+        return True
+
+
+def _release_slot(_future=None):
+    global _in_flight
+    with _slots_lock:
+        _in_flight -= 1
+
+
+def _run(operation, fn, *args, **kwargs):
+    """Run fn in the hashing pool, or raise PasswordHashingBusy.
+
+    Requests beyond PASSWORD_HASH_WORKERS running plus PASSWORD_HASH_QUEUE
+    waiting are refused at once, and a queued request that has not finished
+    within PASSWORD_HASH_TIMEOUT is cancelled, so a login burst costs sync
+    workers a bounded wait instead of their whole CPU.
+    """
+    retry_after = app.config["PASSWORD_HASH_RETRY_AFTER"]
+    started = time.perf_counter()
+    if not app.config["PASSWORD_HASH_WORKERS"]:
+        result = fn(*args, **kwargs)
+        metrics.observe(operation, time.perf_counter() - started)
+        return result
+
+    if not _acquire_slot():
+        metrics.reject()
+        raise PasswordHashingBusy(retry_after=retry_after)
+    try:
+        future = _pool().submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+        _release_slot()
+        _reset_pool()
+        raise PasswordHashingBusy(retry_after=retry_after)
+    # The slot stays taken until the job really ends, even if we stop waiting
+    future.add_done_callback(_release_slot)
+    try:
+        result = future.result(timeout=app.config["PASSWORD_HASH_TIMEOUT"])
+    except FutureTimeout:
+        future.cancel()
+        metrics.reject(timed_out=True)
+        raise PasswordHashingBusy(retry_after=retry_after)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise PasswordHashingBusy(retry_after=retry_after)
+    metrics.observe(operation, time.perf_counter() - started)
+    return result
+
+
+def hash_password(password, operation="hash"):
+    return _run(
+        operation,
+        generate_password_hash,
+        password,
+        method=app.config["PASSWORD_HASH_METHOD"],
+    )
+
+
+def verify_password(password_hash, password):
+    return _run("verify", check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if the hash was made with other parameters than PASSWORD_HASH_METHOD."""
+    return password_hash.split("$", 1)[0] != app.config["PASSWORD_HASH_METHOD"]
@@ -1,21 +1,48 @@
 # routes/routes.py
-import os
-import uuid
 from datetime import datetime
 from functools import wraps
 from sqlite3 import IntegrityError
-from urllib.parse import urljoin
 
-from flask import jsonify, make_response, request
+from flask import jsonify, make_response, request, stream_with_context
 from flask_jwt_extended import (
     create_access_token,
     get_jwt,
     jwt_required,
 )
 from flask_restful import Resource
-from werkzeug.utils import secure_filename
 
-from config import app, blacklist, db
+from config import app, db
+from assets import asset_url, claim_asset, variant_filename, variant_urls
+from auth import revoke_token, role_claims, role_levels
+from bulk import (
+    bulk_update_products,
+    detect_format,
+    export_products,
+    import_products,
+    read_rows,
+)
+from cache import cached_json
+from catalog import (
+    PRODUCT_SORTS,
+    category_in_subtree,
+    category_tree,
+    facet_counts,
+    image_mode,
+    product_filters,
+    product_image_options,
+    serialize_products,
+)
+from fitment import fitment_filter
+from idempotency import idempotent, remember_response
+from images import discard_upload, stage_upload, submit_images
+from inventory import (
+    CANCELLED_STATUSES,
+    PAID_STATUSES,
+    InsufficientStock,
+    allocate_order_stock,
+    release_holds,
+    settle_order_stock,
+)
 from models import (
     Address,
     Brand,
@@ -30,12 +57,23 @@ from models import (
     Role,
     User,
 )
+from pagination import paginate_listing
+from passwords import PasswordHashingBusy, metrics as password_metrics
+from search import search_products
+from serializers import (
+    json_response,
+    load_options,
+    requested_fields,
+    serialize,
+    serialize_many,
+)
 from utils import (
     create_order,
     create_order_items,
-    get_or_create_address,
-    get_or_create_customer,
+    price_order_items,
     str_to_bool,
+    upsert_address,
+    upsert_customer,
 )
 
 
@@ -45,16 +83,20 @@ def authorised_route(required_role_name):
         @jwt_required()
         def wrapper(*args, **kwargs):
             claims = get_jwt()
-            user_role_name = claims.get("role", "user")
-
-            user_role = Role.query.filter_by(name=user_role_name).first()
-            required_role = Role.query.filter_by(name=required_role_name).first()
+            levels = role_levels()
+            current_level = levels.get(claims.get("role", "user"))
+            required_level = levels.get(required_role_name)
 
-            if not user_role or not required_role:
+            if current_level is None or required_level is None:
                 return make_response(jsonify({"message": "Role not found"}), 404)
 
+            # The signed level wins unless the role has been demoted since login
+            user_level = claims.get("role_level")
+            if user_level is None or current_level < user_level:
+                user_level = current_level
+
             # Compare levels (higher or equal level can access)
-            if user_role.level < required_role.level:
+            if user_level < required_level:
                 return make_response(
                     jsonify({"message": "Access denied insufficient permissions"}),
                     403,
@@ -67,6 +109,12 @@ def authorised_route(required_role_name):
     return decorator
 
 
+def hashing_busy_response(error):
+    response = make_response(jsonify({"message": error.description}), 503)
+    response.retry_after = error.retry_after
+    return response
+
+
 class RegisterUser(Resource):
     def post(self):
         data = request.get_json()
@@ -108,6 +156,9 @@ class RegisterUser(Resource):
             db.session.commit()
 
             return make_response(jsonify({"msg": "User created successfully"}), 201)
+        except PasswordHashingBusy as e:
+            db.session.rollback()
+            return hashing_busy_response(e)
         except IntegrityError as e:
             db.session.rollback()
             error_message = str(e.orig)
@@ -160,6 +211,9 @@ class RegisterUsingToken(Resource):
             db.session.commit()
 
             return make_response(jsonify({"msg": "User created successfully"}), 201)
+        except PasswordHashingBusy as e:
+            db.session.rollback()
+            return hashing_busy_response(e)
         except IntegrityError as e:
             db.session.rollback()
             error_message = str(e.orig)
@@ -180,16 +234,18 @@ class LoginUser(Resource):
         password = data.get("password")
 
         user = User.query.filter_by(email=email).first()
-        if not user or not user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordHashingBusy as e:
+            return hashing_busy_response(e)
+        if not valid:
             return {"message": "Invalid credentials"}, 401
+        if db.session.is_modified(user):
+            db.session.commit()  # password hash upgraded to current parameters
 
         access_token = create_access_token(
             identity=str(user.id),
-            additional_claims={
-                "email": user.email,
-                "password_hash": user.password_hash,
-                "role": user.role.name if user.role else "user",
-            },
+            additional_claims=role_claims(user),
         )
         return {
             "msg": "Login successful",
@@ -202,31 +258,42 @@ class LoginUser(Resource):
         }, 200
 
 
+class PasswordHashMetricsResource(Resource):
+    @authorised_route("super_admin")
+    def get(self):
+        # Counters are per app worker process; the pid tells them apart
+        return make_response(jsonify(password_metrics.to_dict()), 200)
+
+
 # API Resource: Logout (Blacklist the Token)
 class LogoutUser(Resource):
     @jwt_required()
     def post(self):
-        jti = get_jwt()["jti"]  # Get token identifier
-        blacklist.add(jti)  # Blacklist the token
+        revoke_token(get_jwt())
         return {"message": "Successfully logged out"}, 200
 
 
 class CategoryResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Category)
         if id is None:
-            categories = [
-                {
-                    **c.to_dict(),
-                    "subcategories": [sub.to_dict() for sub in c.subcategories],
-                }
-                for c in Category.query.filter_by(parent_id=None).all()
-            ]
-            return make_response(jsonify(categories), 200)
-        else:
-            category = Category.query.filter_by(id=id).first()
+            # Full tree of any depth, built from one query
+            return cached_json(("categories",), lambda: category_tree(fields=fields))
+
+        def detail():
+            category = (
+                Category.query.options(*load_options(Category, fields))
+                .filter_by(id=id)
+                .first()
+            )
             if not category:
-                return make_response(jsonify({"msg": "Category not found"}), 404)
-            return make_response(jsonify(category.to_dict()), 200)
+                raise LookupError
+            return serialize(category, fields)
+
+        try:
+            return cached_json(("categories",), detail)
+        except LookupError:
+            return make_response(jsonify({"msg": "Category not found"}), 404)
 
     def post(self):
         data = request.get_json()
@@ -242,7 +309,7 @@ class CategoryResource(Resource):
                 name=data["name"],
                 slug=data["slug"],
                 description=data.get("description"),
-                parent_id=existing_category.parent_id if parent_id else None,
+                parent_id=existing_category.id if parent_id else None,
                 image_url=data.get("image_url"),
             )
             db.session.add(category)
@@ -260,11 +327,19 @@ class CategoryResource(Resource):
             return make_response(jsonify({"msg": "Category not found"}), 404)
 
         data = request.get_json()
+        parent_id = data.get("parent_id", category.parent_id)
+        if parent_id is not None and parent_id != category.parent_id:
+            if not Category.query.filter_by(id=parent_id).first():
+                return make_response(jsonify({"msg": "Parent category not found"}), 404)
+            if category_in_subtree(parent_id, category.id):
+                return make_response(
+                    jsonify({"msg": "Category cannot be moved under itself"}), 400
+                )
         try:
             category.name = data.get("name", category.name)
             category.slug = data.get("slug", category.slug)
             category.description = data.get("description", category.description)
-            category.parent_id = data.get("parent_id", category.parent_id)
+            category.parent_id = parent_id
             category.image_url = data.get("image_url", category.image_url)
             db.session.commit()
             return make_response(jsonify(category.to_dict()), 200)
@@ -286,17 +361,40 @@ class CategoryResource(Resource):
             return make_response(jsonify({"msg": str(e)}), 400)
 
 
+class CategoryTreeResource(Resource):
+    def get(self, id):
+        fields = requested_fields(Category)
+
+        def subtree():
+            tree = category_tree(id, fields)
+            if tree is None:
+                raise LookupError
+            return tree
+
+        try:
+            return cached_json(("categories",), subtree)
+        except LookupError:
+            return make_response(jsonify({"msg": "Category not found"}), 404)
+
+
 class BrandResource(Resource):
     # @authorised_route("super_admin")
     def get(self, id=None):
+        fields = requested_fields(Brand)
+        query = Brand.query.options(*load_options(Brand, fields))
         if id is None:
-            brands = [b.to_dict() for b in Brand.query.all()]
-            return make_response(jsonify(brands), 200)
-        else:
-            brand = Brand.query.filter_by(id=id).first()
+            return cached_json(("brands",), lambda: serialize_many(query.all(), fields))
+
+        def detail():
+            brand = query.filter_by(id=id).first()
             if not brand:
-                return make_response(jsonify({"msg": "Brand not found"}), 404)
-            return make_response(jsonify(brand.to_dict()), 200)
+                raise LookupError
+            return serialize(brand, fields)
+
+        try:
+            return cached_json(("brands",), detail)
+        except LookupError:
+            return make_response(jsonify({"msg": "Brand not found"}), 404)
 
     def post(self):
         data = request.get_json()
@@ -364,14 +462,21 @@ class BrandResource(Resource):
 
 class RoleResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Role)
+        query = Role.query.options(*load_options(Role, fields))
         if id is None:
-            roles = [r.to_dict() for r in Role.query.all()]
-            return make_response(jsonify(roles), 200)
-        else:
-            role = Role.query.filter_by(id=id).first()
+            return cached_json(("roles",), lambda: serialize_many(query.all(), fields))
+
+        def detail():
+            role = query.filter_by(id=id).first()
             if not role:
-                return make_response(jsonify({"msg": "Role not found"}), 404)
-            return make_response(jsonify(role.to_dict()), 200)
+                raise LookupError
+            return serialize(role, fields)
+
+        try:
+            return cached_json(("roles",), detail)
+        except LookupError:
+            return make_response(jsonify({"msg": "Role not found"}), 404)
 
     def post(self):
         data = request.get_json()
@@ -444,41 +549,51 @@ class RoleResource(Resource):
 
 class ProductResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Product)
         if id is None:
-            # Get pagination parameters from query string
-            page = request.args.get("page", 1, type=int)
-            per_page = request.args.get("per_page", 10, type=int)
-
-            # Paginate products
-            paginated_products = Product.query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
 
-            # Serialize paginated results
-            products = [p.to_dict() for p in paginated_products.items]
+            def product_listing():
+                # Page (?page=&per_page=) or cursor (?cursor=&limit=) pagination
+                filters = product_filters(request.args)
+                images = image_mode(request.args)
+                listing = paginate_listing(
+                    Product.query.options(*product_image_options(images)).filter(
+                        *filters.values()
+                    ),
+                    Product,
+                    serialize_page=lambda rows: serialize_products(
+                        rows, images, fields
+                    ),
+                    sorts=PRODUCT_SORTS,
+                    filtered=bool(filters),
+                    fields=fields,
+                )
+                # Opt-in: the counts scan every product matching the filters
+                if str_to_bool(request.args.get("facets", False)):
+                    listing["facets"] = facet_counts(
+                        filters, request.args.get("price_bucket", type=float)
+                    )
+                return listing
 
-            return make_response(
-                jsonify(
-                    {
-                        "content": products,
-                        "total": paginated_products.total,  # Total number of products
-                        "pages": paginated_products.pages,  # Total pages available
-                        "current_page": paginated_products.page,
-                        "per_page": paginated_products.per_page,
-                        "has_next": paginated_products.has_next,  # Boolean: Is there a next page?
-                        "has_prev": paginated_products.has_prev,  # Boolean: Is there a previous page?
-                    }
-                ),
-                200,
-            )
+            try:
+                return cached_json(
+                    ("products", "categories", "brands", "product_images"),
+                    product_listing,
+                )
+            except ValueError as e:
+                return make_response(jsonify({"msg": str(e)}), 400)
         else:
-            product = Product.query.filter_by(id=id).first()
+            product = (
+                Product.query.options(*load_options(Product, fields))
+                .filter_by(id=id)
+                .first()
+            )
             if not product:
                 return make_response(jsonify({"msg": "Product not found"}), 404)
-            product_data = product.to_dict()
+            product_data = serialize(product, fields)
             product_data["images"] = [image.url for image in product.images]
 
-            return make_response(jsonify(product_data), 200)
+            return json_response(product_data)
 
     def post(self):
         data = request.get_json()
@@ -562,6 +677,149 @@ class ProductResource(Resource):
             return make_response(jsonify({"msg": str(e)}), 400)
 
 
+class ProductImportResource(Resource):
+    def post(self):
+        # Catalog files are far larger than the default upload limit
+        request.max_content_length = app.config["IMPORT_MAX_CONTENT_LENGTH"]
+        upload = request.files.get("file")
+        try:
+            if upload is not None:
+                fmt = detect_format(
+                    request.args.get("format"), upload.filename, upload.mimetype
+                )
+                stream = upload.stream
+            else:
+                fmt = detect_format(request.args.get("format"), None, request.mimetype)
+                stream = request.stream
+            report = import_products(
+                stream, fmt, batch_size=request.args.get("batch_size", type=int)
+            )
+        except ValueError as e:
+            return make_response(jsonify({"msg": str(e)}), 400)
+        return make_response(jsonify(report), 200)
+
+
+class ProductBulkUpdateResource(Resource):
+    def patch(self):
+        request.max_content_length = app.config["IMPORT_MAX_CONTENT_LENGTH"]
+        options = {}
+        try:
+            if request.is_json:
+                data = request.get_json()
+                if isinstance(data, dict):
+                    options = data
+                    data = data.get("items") or []
+                if not isinstance(data, list):
+                    raise ValueError("Expected a list of items")
+                items = enumerate(data, 1)
+            else:
+                upload = request.files.get("file")
+                fmt = detect_format(
+                    request.args.get("format"),
+                    upload.filename if upload else None,
+                    upload.mimetype if upload else request.mimetype,
+                )
+                items = read_rows(upload.stream if upload else request.stream, fmt)
+                options = request.args
+            summary = bulk_update_products(
+                items,
+                change_type=options.get("change_type") or "adjustment",
+                reference_id=options.get("reference_id"),
+                notes=options.get("notes"),
+                created_by=options.get("created_by"),
+            )
+        except ValueError as e:
+            db.session.rollback()
+            return make_response(jsonify({"msg": str(e)}), 400)
+        return make_response(jsonify(summary), 200)
+
+
+class ProductExportResource(Resource):
+    def get(self):
+        fields = requested_fields(Product)
+        compress = str_to_bool(request.args.get("gzip", False))
+        try:
+            fmt = detect_format(request.args.get("format", "csv"))
+            filters = product_filters(request.args)
+        except ValueError as e:
+            return make_response(jsonify({"msg": str(e)}), 400)
+
+        columns = [field for field in fields if "." not in field] if fields else None
+        body = export_products(filters.values(), fmt, columns, compress)
+        if compress:
+            mimetype = "application/gzip"
+        else:
+            mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        response = app.response_class(stream_with_context(body), mimetype=mimetype)
+        filename = f"products.{fmt}{'.gz' if compress else ''}"
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        # Let a buffering proxy pass chunks through as they are produced
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+
+class ProductSearchResource(Resource):
+    def get(self):
+        q = request.args.get("q", "").strip()
+        if not q:
+            return make_response(jsonify({"msg": "Missing search query: q"}), 400)
+
+        page = max(1, request.args.get("page", 1, type=int))
+        per_page = max(
+            1,
+            min(
+                request.args.get("per_page", 10, type=int), app.config["MAX_PAGE_SIZE"]
+            ),
+        )
+        fields = requested_fields(Product)
+        # Fetch one extra hit to know whether another page exists
+        results = search_products(
+            q, limit=per_page + 1, offset=(page - 1) * per_page, fields=fields
+        )
+        has_next = len(results) > per_page
+        return make_response(
+            jsonify(
+                {
+                    "content": [
+                        {
+                            **serialize(product, fields),
+                            "rank": rank,
+                            "highlight": highlight,
+                        }
+                        for product, rank, highlight in results[:per_page]
+                    ],
+                    "q": q,
+                    "current_page": page,
+                    "per_page": per_page,
+                    "has_next": has_next,
+                    "has_prev": page > 1,
+                }
+            ),
+            200,
+        )
+
+
+class FitmentResource(Resource):
+    def get(self):
+        make = request.args.get("make", "").strip()
+        if not make:
+            return make_response(
+                jsonify({"msg": "Missing required parameter: make"}), 400
+            )
+        model = request.args.get("model")
+        year = request.args.get("year", type=int)
+        try:
+            listing = paginate_listing(
+                Product.query.filter(fitment_filter(make, model, year)),
+                Product,
+                filtered=True,
+                fields=requested_fields(Product),
+            )
+        except ValueError as e:
+            return make_response(jsonify({"msg": str(e)}), 400)
+        return make_response(jsonify(listing), 200)
+
+
 class ProductRoute(Resource):
     def post(self):
         if not request.content_type.startswith("multipart/form-data"):
@@ -579,41 +837,13 @@ class ProductRoute(Resource):
             return {"msg": "At least one image is required"}, 400
         if not images or all(image.filename == "" for image in images):
             return {"msg": "At least one valid image is required."}, 400
-        saved_images = []
+        staged = []
         try:
-            # Process images
-            upload_dir = app.config["UPLOAD_DIR"]
-            allowed_extensions = app.config["ALLOWED_EXTENSIONS"]
-
-            # Process images
-            for idx, image in enumerate(images):
+            # Stream uploads to temp storage; resizing happens in the image workers
+            for image in images:
                 if image.filename == "":
                     continue
-
-                # Validate file extension
-                filename = secure_filename(image.filename)
-                if (
-                    "." not in filename
-                    or filename.split(".")[-1].lower() not in allowed_extensions
-                ):
-                    return {"msg": "File type not allowed"}, 400
-
-                # Generate unique filename
-                unique_filename = f"{uuid.uuid4().hex[:6]}_{filename}"
-                save_path = os.path.join(
-                    upload_dir, unique_filename
-                )  # Use config-defined path
-
-                # Save file
-                image.save(save_path)
-
-                # Construct URL using configurable domain (if needed)
-                # base_url = request.host_url.rstrip("/") # to revisit
-                server_public_ip_url = "http://54.210.214.53"  # temporary
-                full_url = urljoin(
-                    server_public_ip_url, f"{upload_dir}/{unique_filename}"
-                )
-                saved_images.append({"url": full_url, "is_primary": idx == 0})
+                staged.append(stage_upload(image))
             # check for branch
             existing_branch = Category.query.filter_by(
                 id=int(data["branch_id"])
@@ -630,7 +860,8 @@ class ProductRoute(Resource):
                 name=data["name"],
                 sku=data["sku"],
                 description=data["description"],
-                imgUrl=saved_images[0]["url"],  # Full URL here
+                # Listing variant of the first image, written by the image worker
+                imgUrl=asset_url(variant_filename(staged[0][1], "listing")),
                 price=float(data["price"]),
                 category_id=existing_category.id,
                 cost=data.get("cost"),
@@ -651,16 +882,30 @@ class ProductRoute(Resource):
             db.session.add(product)
             db.session.flush()  # Get product ID for images
 
-            # Create ProductImage entries
-            for img_data in saved_images:
-                img = ProductImage(
-                    product_id=product.id,
-                    url=img_data["url"],
-                    is_primary=img_data["is_primary"],
+            # Create ProductImage entries; known content reuses its variants
+            product_images, jobs = [], {}
+            for idx, (path, digest, size) in enumerate(staged):
+                ready = claim_asset(digest, size) == "ready"
+                if not ready:
+                    jobs.setdefault(digest, path)
+                urls = variant_urls(digest)
+                product_images.append(
+                    ProductImage(
+                        product_id=product.id,
+                        url=urls["zoom_url"],
+                        is_primary=idx == 0,
+                        asset_digest=digest,
+                        status="ready" if ready else "pending",
+                        **(urls if ready else {}),
+                    )
                 )
-                db.session.add(img)
+            db.session.add_all(product_images)
 
             db.session.commit()
+            submit_images(list(jobs.items()))
+            # Queued uploads now belong to the image workers
+            queued = set(jobs.values())
+            staged = [item for item in staged if item[0] not in queued]
             return make_response(
                 jsonify({"msg": f"product {product.name} created suceesfully"}), 201
             )
@@ -671,50 +916,33 @@ class ProductRoute(Resource):
 
         except Exception as e:
             db.session.rollback()
-            for img in saved_images:
-                try:
-                    file_path = os.path.join(
-                        "static", "assets", img["url"].split("/")[-1]
-                    )
-                    os.remove(file_path)
-                except Exception:
-                    pass
             error_msg = str(e).split("\n")[0]
 
             return make_response(jsonify({"msg": error_msg}), 400)
+        finally:
+            # Uploads that never reached the image workers
+            for path, _, _ in staged:
+                discard_upload(path)
 
 
 class CustomerResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Customer)
         if id is None:
-            page = request.args.get("page", 1, type=int)
-            per_page = request.args.get("per_page", 10, type=int)
-
-            # Paginate content
-            paginated_content = Customer.query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
-
-            customers = [c.to_dict() for c in paginated_content.items]
-            return make_response(
-                jsonify(
-                    {
-                        "content": customers,
-                        "total": paginated_content.total,  # Total number of products
-                        "pages": paginated_content.pages,  # Total pages available
-                        "current_page": paginated_content.page,
-                        "per_page": paginated_content.per_page,
-                        "has_next": paginated_content.has_next,  # Boolean: Is there a next page?
-                        "has_prev": paginated_content.has_prev,  # Boolean: Is there a previous page?
-                    }
-                ),
-                200,
-            )
+            try:
+                listing = paginate_listing(Customer.query, Customer, fields=fields)
+            except ValueError as e:
+                return make_response(jsonify({"msg": str(e)}), 400)
+            return make_response(jsonify(listing), 200)
         else:
-            customer = Customer.query.filter_by(id=id).first()
+            customer = (
+                Customer.query.options(*load_options(Customer, fields))
+                .filter_by(id=id)
+                .first()
+            )
             if not customer:
                 return make_response(jsonify({"msg": "Customer not found"}), 404)
-            return make_response(jsonify(customer.to_dict()), 200)
+            return json_response(serialize(customer, fields))
 
     def post(self):
         data = request.get_json()
@@ -767,14 +995,15 @@ class CustomerResource(Resource):
 
 class AddressResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Address)
+        query = Address.query.options(*load_options(Address, fields))
         if id is None:
-            addresses = [a.to_dict() for a in Address.query.all()]
-            return make_response(jsonify(addresses), 200)
+            return json_response(serialize_many(query.all(), fields))
         else:
-            address = Address.query.filter_by(id=id).first()
+            address = query.filter_by(id=id).first()
             if not address:
                 return make_response(jsonify({"msg": "Address not found"}), 404)
-            return make_response(jsonify(address.to_dict()), 200)
+            return json_response(serialize(address, fields))
 
     def post(self):
         data = request.get_json()
@@ -829,34 +1058,22 @@ class AddressResource(Resource):
 
 class OrderResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Order)
         if id is None:
-            page = request.args.get("page", 1, type=int)
-            per_page = request.args.get("per_page", 10, type=int)
-
-            # Paginate content
-            paginated_content = Order.query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
-            orders = [o.to_dict() for o in paginated_content.items]
-            return make_response(
-                jsonify(
-                    {
-                        "content": orders,
-                        "total": paginated_content.total,  # Total number of products
-                        "pages": paginated_content.pages,  # Total pages available
-                        "current_page": paginated_content.page,
-                        "per_page": paginated_content.per_page,
-                        "has_next": paginated_content.has_next,  # Boolean: Is there a next page?
-                        "has_prev": paginated_content.has_prev,  # Boolean: Is there a previous page?
-                    }
-                ),
-                200,
-            )
+            try:
+                listing = paginate_listing(Order.query, Order, fields=fields)
+            except ValueError as e:
+                return make_response(jsonify({"msg": str(e)}), 400)
+            return make_response(jsonify(listing), 200)
         else:
-            order = Order.query.filter_by(id=id).first()
+            order = (
+                Order.query.options(*load_options(Order, fields))
+                .filter_by(id=id)
+                .first()
+            )
             if not order:
                 return make_response(jsonify({"msg": "Order not found"}), 404)
-            return make_response(jsonify(order.to_dict()), 200)
+            return json_response(serialize(order, fields))
 
     def post(self):
         data = request.get_json()
@@ -893,6 +1110,7 @@ class OrderResource(Resource):
             return make_response(jsonify({"msg": "Order not found"}), 404)
 
         data = request.get_json()
+        was_paid = (order.payment_status or "").lower() in PAID_STATUSES
         try:
             for field in [
                 "customer_id",
@@ -916,8 +1134,21 @@ class OrderResource(Resource):
                 if field in data:
                     setattr(order, field, data[field])
 
+            payment_status = (order.payment_status or "").lower()
+            if payment_status in PAID_STATUSES and not was_paid:
+                settle_order_stock(order)
+            elif {payment_status, (order.status or "").lower()} & set(
+                CANCELLED_STATUSES
+            ):
+                release_holds(order.id)
+
             db.session.commit()
             return make_response(jsonify(order.to_dict()), 200)
+        except InsufficientStock as e:
+            db.session.rollback()
+            return make_response(
+                jsonify({"msg": str(e), "shortfalls": e.shortfalls}), 409
+            )
         except Exception as e:
             db.session.rollback()
             return make_response(jsonify({"msg": str(e)}), 400)
@@ -928,6 +1159,7 @@ class OrderResource(Resource):
             return make_response(jsonify({"msg": "Order not found"}), 404)
 
         try:
+            release_holds(order.id)
             db.session.delete(order)
             db.session.commit()
             return make_response(jsonify({"msg": "Order deleted"}), 200)
@@ -938,14 +1170,15 @@ class OrderResource(Resource):
 
 class OrderItemResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(OrderItem)
+        query = OrderItem.query.options(*load_options(OrderItem, fields))
         if id is None:
-            items = [i.to_dict() for i in OrderItem.query.all()]
-            return make_response(jsonify(items), 200)
+            return json_response(serialize_many(query.all(), fields))
         else:
-            item = OrderItem.query.filter_by(id=id).first()
+            item = query.filter_by(id=id).first()
             if not item:
                 return make_response(jsonify({"msg": "Order item not found"}), 404)
-            return make_response(jsonify(item.to_dict()), 200)
+            return json_response(serialize(item, fields))
 
     def post(self):
         data = request.get_json()
@@ -998,14 +1231,15 @@ class OrderItemResource(Resource):
 
 class UserResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(User)
+        query = User.query.options(*load_options(User, fields))
         if id is None:
-            users = [u.to_dict() for u in User.query.all()]
-            return make_response(jsonify(users), 200)
+            return json_response(serialize_many(query.all(), fields))
         else:
-            user = User.query.filter_by(id=id).first()
+            user = query.filter_by(id=id).first()
             if not user:
                 return make_response(jsonify({"msg": "User not found"}), 404)
-            return make_response(jsonify(user.to_dict()), 200)
+            return json_response(serialize(user, fields))
 
     def post(self):
         data = request.get_json()
@@ -1061,14 +1295,15 @@ class UserResource(Resource):
 
 class ReviewResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(Review)
+        query = Review.query.options(*load_options(Review, fields))
         if id is None:
-            reviews = [r.to_dict() for r in Review.query.all()]
-            return make_response(jsonify(reviews), 200)
+            return json_response(serialize_many(query.all(), fields))
         else:
-            review = Review.query.filter_by(id=id).first()
+            review = query.filter_by(id=id).first()
             if not review:
                 return make_response(jsonify({"msg": "Review not found"}), 404)
-            return make_response(jsonify(review.to_dict()), 200)
+            return json_response(serialize(review, fields))
 
     def post(self):
         data = request.get_json()
@@ -1121,14 +1356,15 @@ class ReviewResource(Resource):
 
 class InventoryLogResource(Resource):
     def get(self, id=None):
+        fields = requested_fields(InventoryLog)
+        query = InventoryLog.query.options(*load_options(InventoryLog, fields))
         if id is None:
-            logs = [log.to_dict() for log in InventoryLog.query.all()]
-            return make_response(jsonify(logs), 200)
+            return json_response(serialize_many(query.all(), fields))
         else:
-            log = InventoryLog.query.filter_by(id=id).first()
+            log = query.filter_by(id=id).first()
             if not log:
                 return make_response(jsonify({"msg": "Inventory log not found"}), 404)
-            return make_response(jsonify(log.to_dict()), 200)
+            return json_response(serialize(log, fields))
 
     def post(self):
         data = request.get_json()
@@ -1191,16 +1427,17 @@ def process_order():
 
     try:
         # Start transaction
-        customer, is_new_customer = get_or_create_customer(data)
-        db.session.flush()
+        customer_id, is_new_customer = upsert_customer(data)
+        address_id, is_new_shipping = upsert_address(data, customer_id)
 
-        address, is_new_shipping = get_or_create_address(data, customer.id)
-        db.session.flush()
-
-        order = create_order(data, customer.id, address.id)
+        items, items_total = price_order_items(data["order_items"])
+        order = create_order(data, customer_id, address_id, items_total)
         db.session.flush()  # Flush to get order ID
 
-        create_order_items(data["order_items"], order.id)
+        create_order_items(items, order.id)
+        allocate_order_stock(
+            order, [(item["product_id"], item["quantity"]) for item in items]
+        )
 
         # Commit transaction
         db.session.commit()
@@ -1215,6 +1452,10 @@ def process_order():
             jsonify({"msg": "Database Integrity Error", "error": str(e)}), 400
         )
 
+    except InsufficientStock as e:
+        db.session.rollback()
+        return make_response(jsonify({"msg": str(e), "shortfalls": e.shortfalls}), 409)
+
     except ValueError as e:
         db.session.rollback()
         return make_response(jsonify({"msg": str(e)}), 400)
@@ -1227,29 +1468,31 @@ def process_order():
 
 
 class OrderProcess(Resource):
+    @idempotent("create-order")
     def post(self):
         data = request.get_json()
         try:
-            customer, is_new_customer = get_or_create_customer(data["customer"])
-            db.session.flush()
+            customer_id, is_new_customer = upsert_customer(data["customer"])
+            address_id, is_new_shipping = upsert_address(data["address"], customer_id)
 
-            shipping_address, is_new_shipping = get_or_create_address(
-                data["address"], customer.id
-            )
+            items, items_total = price_order_items(data["order_items"])
+            order = create_order(data["order"], customer_id, address_id, items_total)
             db.session.flush()
 
-            order = create_order(data["order"], customer.id, shipping_address.id)
-            db.session.flush()
+            create_order_items(items, order.id)
+            # Last before commit: the product rows stay locked until then
+            allocate_order_stock(
+                order, [(item["product_id"], item["quantity"]) for item in items]
+            )
 
-            create_order_items(data["order_items"], order.id)
+            payload = {"msg": "Order placed successfully", "order": order.to_dict()}
+            # Saved with the order, so a retry replays exactly this response
+            remember_response(payload, 201)
 
             # Commit transaction
             db.session.commit()
 
-            return make_response(
-                jsonify({"msg": "Order placed successfully", "order": order.to_dict()}),
-                201,
-            )
+            return make_response(jsonify(payload), 201)
 
         except IntegrityError as e:
             db.session.rollback()
@@ -1257,6 +1500,12 @@ class OrderProcess(Resource):
                 jsonify({"msg": "Database Integrity Error", "error": str(e)}), 400
             )
 
+        except InsufficientStock as e:
+            db.session.rollback()
+            return make_response(
+                jsonify({"msg": str(e), "shortfalls": e.shortfalls}), 409
+            )
+
         except ValueError as e:
             db.session.rollback()
             return make_response(jsonify({"msg": str(e)}), 400)
@@ -0,0 +1,206 @@
+# search.py
+import re
+
+from sqlalchemy import bindparam, event, text
+
+from config import db
+from models import Product
+from serializers import load_options
+
+# Searchable product columns, in FTS column order, with their Postgres weight
+# (keep in step with migration 8e3d52b0c4a7)
+SEARCH_FIELDS = (
+    ("name", "A"),
+    ("sku", "A"),
+    ("compatible_makes", "B"),
+    ("compatible_models", "B"),
+    ("features", "C"),
+    ("description", "D"),
+)
+MAX_QUERY_TERMS = 8
+
+_pg_vector = " ||\n".join(
+    f"setweight(to_tsvector('simple', coalesce({field}, '')), '{weight}')"
+    for field, weight in SEARCH_FIELDS
+)
+# Generated column: Postgres keeps it in sync with every product write itself
+PG_SEARCH_DDL = (
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS ({_pg_vector}) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector "
+    "ON products USING gin (search_vector)",
+)
+
+_fts_columns = ", ".join(field for field, _ in SEARCH_FIELDS)
+SQLITE_SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5({_fts_columns})"
+)
+
+PG_SEARCH_SQL = """
+SELECT p.id, hit.rank,
+       ts_headline('simple', p.name, hit.query,
+                   'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') AS name_hl,
+       ts_headline('simple', p.description, hit.query,
+                   'StartSel=<mark>, StopSel=</mark>, MaxWords=20, MinWords=5')
+           AS description_hl
+FROM (
+    SELECT id, query, ts_rank_cd(search_vector, query) AS rank
+    FROM products, to_tsquery('simple', :q) AS query
+    WHERE search_vector @@ query
+    ORDER BY rank DESC, id
+    LIMIT :limit OFFSET :offset
+) AS hit
+JOIN products p ON p.id = hit.id
+ORDER BY hit.rank DESC, p.id
+"""
+
+SQLITE_SEARCH_SQL = """
+SELECT rowid AS id,
+       -bm25(products_fts, 10.0, 10.0, 4.0, 4.0, 2.0, 1.0) AS rank,
+       highlight(products_fts, 0, '<mark>', '</mark>') AS name_hl,
+       snippet(products_fts, 5, '<mark>', '</mark>', '...', 20) AS description_hl
+FROM products_fts
+WHERE products_fts MATCH :q
+ORDER BY rank DESC, id
+LIMIT :limit OFFSET :offset
+"""
+
+
+def query_terms(q):
+    """Split free text into at most MAX_QUERY_TERMS lower-cased word tokens."""
+    return re.findall(r"\w+", (q or "").lower())[:MAX_QUERY_TERMS]
+
+
+def _fts_row(source):
+    return {field: getattr(source, field) for field, _ in SEARCH_FIELDS}
+
+
+def init_search_index():
+    """Create the search index for a database built with create_all().
+
+    Migrated databases already have it. The DDL only runs when the index is
+    missing, since on Postgres it locks products while the column is filled.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        exists = db.session.execute(
+            text(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = "
+                "'products' AND column_name = 'search_vector' "
+                "AND table_schema = current_schema()"
+            )
+        ).first()
+        if not exists:
+            for statement in PG_SEARCH_DDL:
+                db.session.execute(text(statement))
+    elif dialect == "sqlite":
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")
+        ).first()
+        if not exists:
+            db.session.execute(text(SQLITE_SEARCH_DDL))
+            rebuild_search_index()
+    db.session.commit()
+
+
+def rebuild_search_index():
+    """Repopulate the SQLite FTS table from products (Postgres needs no rebuild)."""
+    if db.engine.dialect.name != "sqlite":
+        return
+    db.session.execute(text("DELETE FROM products_fts"))
+    db.session.execute(
+        text(
+            f"INSERT INTO products_fts(rowid, {_fts_columns}) "
+            f"SELECT id, {_fts_columns} FROM products"
+        )
+    )
+
+
+def reindex_products(product_ids):
+    """Refresh the SQLite FTS rows of products written with Core statements."""
+    if db.engine.dialect.name != "sqlite" or not product_ids:
+        return
+    ids = bindparam("ids", expanding=True)
+    db.session.execute(
+        text("DELETE FROM products_fts WHERE rowid IN :ids").bindparams(ids),
+        {"ids": list(product_ids)},
+    )
+    db.session.execute(
+        text(
+            f"INSERT INTO products_fts(rowid, {_fts_columns}) "
+            f"SELECT id, {_fts_columns} FROM products WHERE id IN :ids"
+        ).bindparams(ids),
+        {"ids": list(product_ids)},
+    )
+
+
+def search_products(q, limit=10, offset=0, fields=None):
+    """Return ranked [(product, rank, highlight)] for a free text query."""
+    terms = query_terms(q)
+    if not terms:
+        return []
+    if db.engine.dialect.name == "postgresql":
+        sql, match = PG_SEARCH_SQL, " & ".join(f"{term}:*" for term in terms)
+    else:
+        sql, match = SQLITE_SEARCH_SQL, " ".join(f'"{term}"*' for term in terms)
+    hits = db.session.execute(
+        text(sql), {"q": match, "limit": limit, "offset": offset}
+    ).all()
+    if not hits:
+        return []
+    products = {
+        p.id: p
+        for p in Product.query.options(*load_options(Product, fields)).filter(
+            Product.id.in_([hit.id for hit in hits])
+        )
+    }
+    return [
+        (
+            products[hit.id],
+            float(hit.rank),
+            {"name": hit.name_hl, "description": hit.description_hl},
+        )
+        for hit in hits
+        if hit.id in products
+    ]
+
+
+# SQLite has no generated tsvector, so keep the FTS table in step with the ORM
+@event.listens_for(Product, "after_insert")
+def _index_product(mapper, connection, target):
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(
+        text(
+            f"INSERT INTO products_fts(rowid, {_fts_columns}) "
+            f"VALUES (:id, {', '.join(':' + f for f, _ in SEARCH_FIELDS)})"
+        ),
+        {"id": target.id, **_fts_row(target)},
+    )
+
+
+@event.listens_for(Product, "after_update")
+def _reindex_product(mapper, connection, target):
+    if connection.dialect.name != "sqlite":
+        return
+    # Only touch changed columns so deferred text is never loaded mid-flush
+    state = db.inspect(target)
+    changed = [
+        field for field, _ in SEARCH_FIELDS if state.attrs[field].history.has_changes()
+    ]
+    if not changed:
+        return
+    assignments = ", ".join(f"{field} = :{field}" for field in changed)
+    connection.execute(
+        text(f"UPDATE products_fts SET {assignments} WHERE rowid = :id"),
+        {"id": target.id, **{field: getattr(target, field) for field in changed}},
+    )
+
+
+@event.listens_for(Product, "after_delete")
+def _unindex_product(mapper, connection, target):
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(
+        text("DELETE FROM products_fts WHERE rowid = :id"), {"id": target.id}
+    )
@@ -0,0 +1,111 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Configuration is read at import time, so set it before importing the app
+_tmp = tempfile.mkdtemp(prefix="autospares-tests-")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ["UPLOAD_TMP_DIR"] = os.path.join(_tmp, "uploads")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import app as _app  # noqa: E402,F401 registers the blueprints
+import cache  # noqa: E402
+import pagination  # noqa: E402
+from config import app, db  # noqa: E402
+from models import Brand, Category, Product  # noqa: E402
+from search import init_search_index  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """A fresh schema and empty caches for every test."""
+    with app.app_context():
+        db.session.execute(text("DROP TABLE IF EXISTS products_fts"))
+        db.session.commit()
+        db.drop_all()
+        db.create_all()
+        init_search_index()
+    cache._cache = None
+    pagination._count_cache.clear()
+    yield
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def make_products():
+    """Create n products (stock 5 by default) and return their ids."""
+
+    def make(n, **values):
+        with app.app_context():
+            category = Category.query.first() or Category(name="Brakes", slug="brakes")
+            brand = Brand.query.first() or Brand(name="Bosch", slug="bosch")
+            db.session.add_all([category, brand])
+            db.session.flush()
+            start = db.session.query(Product).count()
+            products = [
+                Product(
+                    name=f"Brake pad {start + i}",
+                    sku=f"SKU{start + i}",
+                    description="brake pad",
+                    imgUrl="x",
+                    price=10 + i,
+                    category_id=category.id,
+                    brand_id=brand.id,
+                    **{"stock": 5, **values},
+                )
+                for i in range(n)
+            ]
+            db.session.add_all(products)
+            db.session.commit()
+            return [product.id for product in products]
+
+    return make
+
+
+def _order_payload(items, email="customer@example.com", **order):
+    return {
+        "customer": {
+            "first_name": "Jane",
+            "last_name": "Doe",
+            "email": email,
+            "phone": "0700000000",
+        },
+        "address": {
+            "specific_address": "1 Kimathi St",
+            "county": "Nairobi",
+            "area_town": "CBD",
+            "city_town": "Nairobi",
+        },
+        "order": {
+            "status": "pending",
+            "total_amount": 0,
+            "payment_method": "mpesa",
+            "payment_status": "pending",
+            "shipping_cost": "200",
+            **order,
+        },
+        "order_items": [
+            {"product_id": product_id, "quantity": quantity}
+            for product_id, quantity in items
+        ],
+    }
+
+
+@pytest.fixture
+def order_payload():
+    """Build a /create-order/process body from [(product_id, quantity)]."""
+    return _order_payload
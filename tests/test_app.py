@@ -0,0 +1,38 @@
+# tests/test_app.py
+import fcntl
+
+import pytest
+
+import app as app_module
+from config import app, scheduler
+
+
+@pytest.fixture
+def scheduler_config(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "SCHEDULER_ENABLED", True)
+    monkeypatch.setitem(
+        app.config, "SCHEDULER_LOCK_FILE", str(tmp_path / "scheduler.lock")
+    )
+    yield app.config["SCHEDULER_LOCK_FILE"]
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    if app_module._scheduler_lock is not None:
+        app_module._scheduler_lock.close()
+        app_module._scheduler_lock = None
+
+
+def test_only_the_lock_holder_starts_the_scheduler(scheduler_config):
+    # Another worker holds the lock
+    with open(scheduler_config, "a") as other:
+        fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert app_module.start_scheduler() is False
+        assert not scheduler.running
+
+    # It exited, so the next worker takes over
+    assert app_module.start_scheduler() is True
+    assert scheduler.running
+    assert {job.id for job in scheduler.get_jobs()} >= {
+        "release-expired-holds",
+        "purge-idempotency-keys",
+    }
+    assert app_module.start_scheduler() is False
@@ -0,0 +1,112 @@
+# tests/test_bulk.py
+import io
+
+from sqlalchemy import select
+
+import bulk
+from bulk import import_products
+from config import app, db
+from models import Product
+
+CHECKOUT = "/api/v1/create-order/process"
+
+
+def _import(csv_text):
+    with app.app_context():
+        return import_products(io.BytesIO(csv_text.encode()), "csv")
+
+
+def test_import_creates_new_products(make_products):
+    make_products(1)  # the category and brand to look up
+
+    report = _import("sku,name,price,category\nNEW1,Oil filter,450,brakes\n")
+
+    assert (report["created"], report["failed"]) == (1, 0), report["errors"]
+    with app.app_context():
+        product = Product.query.filter_by(sku="NEW1").one()
+        assert (product.stock, product.reserved, product.available_stock) == (0, 0, 0)
+
+
+def test_import_leaves_held_stock_alone(client, make_products, order_payload):
+    (product_id,) = make_products(1)
+    response = client.post(CHECKOUT, json=order_payload([(product_id, 2)]))
+    assert response.status_code == 201
+
+    report = _import("sku,stock,reserved\nSKU0,8,0\n")
+
+    assert (report["updated"], report["failed"]) == (1, 0), report["errors"]
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        assert (product.stock, product.reserved, product.available_stock) == (8, 2, 6)
+
+
+def test_bulk_update_rejects_stock_below_held_units(
+    client, make_products, order_payload
+):
+    held, free = make_products(2)
+    response = client.post(CHECKOUT, json=order_payload([(held, 3)]))
+    assert response.status_code == 201
+
+    response = client.patch(
+        "/api/v1/products/bulk",
+        json=[{"sku": "SKU0", "stock": 2}, {"sku": "SKU1", "stock": 2}],
+    )
+
+    assert response.status_code == 200
+    assert response.json["affected"] == 1
+    assert [error["line"] for error in response.json["errors"]] == [1]
+    with app.app_context():
+        assert db.session.get(Product, held).stock == 5
+        assert db.session.get(Product, free).stock == 2
+
+
+def test_import_accepts_a_bare_year_as_compatible_models(make_products):
+    make_products(1)
+
+    report = _import(
+        "sku,name,price,category,compatible_makes,compatible_models\n"
+        "NEW1,Oil filter,450,brakes,Toyota,2014\n"
+    )
+
+    assert (report["created"], report["failed"]) == (1, 0), report["errors"]
+
+
+def test_a_row_failing_in_derived_writes_is_a_line_error(make_products, monkeypatch):
+    make_products(1)
+    refresh = bulk.refresh_fitments
+
+    def refresh_fitments(connection, product_ids):
+        names = db.session.scalars(
+            select(Product.name).where(Product.id.in_(product_ids))
+        ).all()
+        if "Bad" in names:
+            raise TypeError("'int' object is not iterable")
+        refresh(connection, product_ids)
+
+    monkeypatch.setattr(bulk, "refresh_fitments", refresh_fitments)
+
+    report = _import(
+        "sku,name,price,category,compatible_makes\n"
+        "NEW1,Good,450,brakes,Toyota\n"
+        "NEW2,Bad,450,brakes,Toyota\n"
+        "NEW3,Good too,450,brakes,Toyota\n"
+    )
+
+    assert (report["created"], report["failed"]) == (2, 1)
+    assert report["errors"] == [
+        {"line": 3, "sku": "NEW2", "error": "'int' object is not iterable"}
+    ]
+    with app.app_context():
+        assert Product.query.filter(Product.sku.like("NEW%")).count() == 2
+
+
+def test_bulk_update_reports_items_that_are_not_objects(client, make_products):
+    make_products(1)
+
+    response = client.patch(
+        "/api/v1/products/bulk", json=["SKU0", 5, {"sku": "SKU0", "stock": 7}]
+    )
+
+    assert response.status_code == 200
+    assert response.json["affected"] == 1
+    assert [error["line"] for error in response.json["errors"]] == [1, 2]
@@ -0,0 +1,47 @@
+# tests/test_cache.py
+import shutil
+
+import pytest
+
+import cache
+from cache import FileSystemCache, MemoryCache, check_workers
+from config import app
+
+
+def test_versions_do_not_repeat_after_the_cache_directory_is_wiped(tmp_path):
+    directory = str(tmp_path / "cache")
+    before = FileSystemCache(directory, 10).get_version("products")
+    assert FileSystemCache(directory, 10).get_version("products") == before
+
+    shutil.rmtree(directory)
+
+    assert FileSystemCache(directory, 10).get_version("products") != before
+
+
+def test_memory_versions_do_not_repeat_across_processes():
+    assert MemoryCache(10).get_version("products") != MemoryCache(10).get_version(
+        "products"
+    )
+
+
+def test_an_etag_from_before_a_restart_is_not_honoured(client, make_products):
+    make_products(1)
+    etag = client.get("/api/v1/products").headers["ETag"]
+    assert (
+        client.get("/api/v1/products", headers={"If-None-Match": etag}).status_code
+        == 304
+    )
+
+    cache._cache = None  # a restarted worker with an empty memory cache
+
+    response = client.get("/api/v1/products", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_memory_backend_is_refused_for_several_workers(monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", "memory")
+    check_workers(1)
+    with pytest.raises(RuntimeError, match="single-worker"):
+        check_workers(4)
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", "tiered")
+    check_workers(4)
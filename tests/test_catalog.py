@@ -0,0 +1,93 @@
+# tests/test_catalog.py
+from sqlalchemy import event
+
+import cache
+import pagination
+from config import app, db
+from models import Product, ProductImage
+
+CHECKOUT = "/api/v1/create-order/process"
+
+
+def test_in_stock_filter_leaves_out_fully_held_products(
+    client, make_products, order_payload
+):
+    held, free = make_products(2)
+    response = client.post(CHECKOUT, json=order_payload([(held, 5)]))
+    assert response.status_code == 201
+
+    in_stock = client.get("/api/v1/products?in_stock=true").json
+    out_of_stock = client.get("/api/v1/products?in_stock=false").json
+
+    assert [product["id"] for product in in_stock["content"]] == [free]
+    assert [product["id"] for product in out_of_stock["content"]] == [held]
+
+
+def _statements(client, url):
+    # Measure a cold request every time
+    cache._cache = None
+    pagination._count_cache.clear()
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    return response.json, len(statements)
+
+
+def test_image_gallery_costs_the_same_statements_for_any_page_size(
+    client, make_products
+):
+    ids = make_products(100)
+    with app.app_context():
+        db.session.add_all(
+            ProductImage(product_id=product_id, url=f"/img/{product_id}-{n}.jpg")
+            for product_id in ids
+            for n in range(2)
+        )
+        db.session.commit()
+
+    small, small_count = _statements(
+        client, "/api/v1/products?images=all&facets=false&per_page=10"
+    )
+    large, large_count = _statements(
+        client, "/api/v1/products?images=all&facets=false&per_page=100"
+    )
+
+    assert (len(small["content"]), len(large["content"])) == (10, 100)
+    assert all(len(product["images"]) == 2 for product in large["content"])
+    assert small_count == large_count <= 3
+
+
+def test_facets_are_opt_in(client, make_products):
+    make_products(1)
+
+    assert "facets" not in client.get("/api/v1/products").json
+    assert "facets" in client.get("/api/v1/products?facets=true").json
+
+
+def test_price_histogram_is_bounded(client, make_products, monkeypatch):
+    ids = make_products(3)
+    with app.app_context():
+        for product_id, price in zip(ids, (5, 25, 1000000)):
+            db.session.get(Product, product_id).price = price
+        db.session.commit()
+    monkeypatch.setitem(app.config, "PRICE_BUCKET_MAX", 3)
+
+    response = client.get("/api/v1/products?facets=true&price_bucket=10")
+
+    assert response.status_code == 200
+    assert response.json["facets"]["price"] == [
+        {"min": 0, "max": 10, "count": 1},
+        {"min": 20, "max": None, "count": 2},
+    ]
+    too_narrow = client.get("/api/v1/products?facets=true&price_bucket=0.001")
+    assert too_narrow.status_code == 400
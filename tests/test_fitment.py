@@ -0,0 +1,85 @@
+# tests/test_fitment.py
+import pytest
+
+from config import app, db
+from fitment import parse_fitments
+from models import Product, ProductFitment
+
+
+def _fit(make, model=None, year_from=None, year_to=None):
+    return {"make": make, "model": model, "year_from": year_from, "year_to": year_to}
+
+
+def test_models_with_year_ranges_pair_with_their_make():
+    assert parse_fitments(
+        '["Toyota", "Nissan"]', '["Toyota Corolla 2010-2015", "Note"]'
+    ) == sorted(
+        [
+            _fit("toyota", "corolla", 2010, 2015),
+            _fit("toyota", "note"),
+            _fit("nissan", "note"),
+        ],
+        key=lambda row: str(tuple(row.values())),
+    )
+
+
+def test_comma_separated_text_and_objects():
+    assert parse_fitments("Toyota, Mazda", None) == [_fit("mazda"), _fit("toyota")]
+    assert parse_fitments(
+        None, '[{"make": "Honda", "model": "Fit", "year_from": "2008"}]'
+    ) == [_fit("honda", "fit", 2008)]
+
+
+@pytest.mark.parametrize(
+    "makes, models, expected",
+    [
+        ("Toyota", "2014", [_fit("toyota", None, 2014, 2014)]),
+        ("Toyota", "null", [_fit("toyota")]),
+        ("null", "null", []),
+        ("5", '[{"model": 5}]', [_fit("5", "5")]),
+        ('[{"make": 7}]', '[null, 2010, ""]', [_fit("7", None, 2010, 2010)]),
+        ("true", "{}", [_fit("true")]),
+    ],
+)
+def test_json_that_is_not_a_list_of_strings(makes, models, expected):
+    assert parse_fitments(makes, models) == expected
+
+
+def test_patching_a_bare_year_is_accepted(client, make_products):
+    (product_id,) = make_products(1, compatible_makes="Toyota")
+
+    response = client.patch(
+        f"/api/v1/product/{product_id}", json={"compatible_models": "2014"}
+    )
+
+    assert response.status_code == 200
+    with app.app_context():
+        fitments = ProductFitment.query.filter_by(product_id=product_id).all()
+        assert [(f.make, f.model, f.year_from) for f in fitments] == [
+            ("toyota", None, 2014)
+        ]
+
+
+def test_fitment_lookup_matches_make_model_and_year(client, make_products):
+    corolla, any_toyota, nissan = make_products(3)
+    with app.app_context():
+        for product_id, makes, models in (
+            (corolla, '["Toyota"]', '["Corolla 2010-2015"]'),
+            (any_toyota, "Toyota", None),
+            (nissan, "Nissan", "Note"),
+        ):
+            product = db.session.get(Product, product_id)
+            product.compatible_makes, product.compatible_models = makes, models
+        db.session.commit()
+
+    def fits(query):
+        response = client.get(f"/api/v1/fitment?{query}")
+        assert response.status_code == 200
+        return sorted(product["id"] for product in response.json["content"])
+
+    assert fits("make=toyota") == [corolla, any_toyota]
+    assert fits("make=Toyota&model=corolla&year=2012") == [corolla, any_toyota]
+    assert fits("make=Toyota&model=Corolla&year=2018") == [any_toyota]
+    assert fits("make=Toyota&model=Yaris") == [any_toyota]
+    assert fits("make=nissan&model=note") == [nissan]
+    assert client.get("/api/v1/fitment").status_code == 400
@@ -0,0 +1,142 @@
+# tests/test_idempotency.py
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import app, db
+from idempotency import _fingerprint
+from models import IdempotencyKey, Order, Product
+
+CHECKOUT = "/api/v1/create-order/process"
+
+
+def _post(client, payload, key="key-1"):
+    return client.post(CHECKOUT, json=payload, headers={"Idempotency-Key": key})
+
+
+def _orders():
+    with app.app_context():
+        return Order.query.count()
+
+
+def _in_progress(payload, locked_at=None, key="key-1"):
+    with app.test_request_context(CHECKOUT, method="POST", json=payload):
+        fingerprint = _fingerprint()
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.add(
+            IdempotencyKey(
+                scope="create-order",
+                key=key,
+                fingerprint=fingerprint,
+                status="in_progress",
+                locked_at=locked_at or now,
+                expires_at=now + timedelta(hours=1),
+            )
+        )
+        db.session.commit()
+
+
+def test_a_retry_replays_the_first_response(client, make_products, order_payload):
+    (product,) = make_products(1)
+    payload = order_payload([(product, 1)])
+
+    first = _post(client, payload)
+    retry = _post(client, payload)
+
+    assert (first.status_code, retry.status_code) == (201, 201)
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json == first.json
+    assert _orders() == 1
+
+
+def test_requests_without_a_key_are_not_deduplicated(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    payload = order_payload([(product, 1)])
+
+    client.post(CHECKOUT, json=payload)
+    client.post(CHECKOUT, json=payload)
+
+    assert _orders() == 2
+
+
+def test_a_key_reused_for_another_body_is_refused(client, make_products, order_payload):
+    (product,) = make_products(1)
+    assert _post(client, order_payload([(product, 1)])).status_code == 201
+
+    response = _post(client, order_payload([(product, 2)]))
+
+    assert response.status_code == 422
+    assert _orders() == 1
+
+
+def test_a_failed_attempt_releases_the_key(client, make_products, order_payload):
+    (product,) = make_products(1, stock=1)
+    payload = order_payload([(product, 2)])
+    assert _post(client, payload).status_code == 409
+
+    with app.app_context():
+        db.session.get(Product, product).stock = 5
+        db.session.commit()
+    retry = _post(client, payload)
+
+    assert retry.status_code == 201
+    assert "Idempotent-Replayed" not in retry.headers
+    assert _orders() == 1
+
+
+def test_a_duplicate_waits_for_the_attempt_in_progress(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    payload = order_payload([(product, 1)])
+    _in_progress(payload)
+    results = []
+    waiter = threading.Thread(
+        target=lambda: results.append(_post(app.test_client(), payload))
+    )
+    waiter.start()
+
+    time.sleep(0.3)
+    with app.app_context():
+        row = IdempotencyKey.query.one()
+        row.status, row.response_status = "completed", 201
+        row.response_body = '{"msg":"Order placed successfully"}'
+        db.session.commit()
+    waiter.join(timeout=5)
+
+    (response,) = results
+    assert response.status_code == 201
+    assert response.json == {"msg": "Order placed successfully"}
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert _orders() == 0
+
+
+def test_a_duplicate_gives_up_waiting_with_409(
+    client, make_products, order_payload, monkeypatch
+):
+    (product,) = make_products(1)
+    payload = order_payload([(product, 1)])
+    _in_progress(payload)
+    monkeypatch.setitem(app.config, "IDEMPOTENCY_WAIT_TIMEOUT", 0.2)
+
+    response = _post(client, payload)
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert _orders() == 0
+
+
+def test_a_key_abandoned_mid_request_is_taken_over(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    payload = order_payload([(product, 1)])
+    _in_progress(payload, locked_at=datetime.utcnow() - timedelta(hours=1))
+
+    response = _post(client, payload)
+
+    assert response.status_code == 201
+    assert _orders() == 1
@@ -0,0 +1,46 @@
+# tests/test_images.py
+from datetime import datetime, timedelta
+
+from assets import asset_url, variant_filename
+from config import app, db
+from images import fail_stale_images
+from models import Asset, Product, ProductImage
+
+
+def _pending_image(digest, age):
+    listing = asset_url(variant_filename(digest, "listing"))
+    with app.app_context():
+        product = Product.query.filter_by(sku=f"SKU-{digest[:4]}").one()
+        product.imgUrl = listing
+        db.session.add(Asset(digest=digest, status="pending", ref_count=1))
+        db.session.add(
+            ProductImage(
+                product_id=product.id,
+                url=asset_url(variant_filename(digest, "zoom")),
+                asset_digest=digest,
+                status="pending",
+                created_at=datetime.utcnow() - timedelta(seconds=age),
+            )
+        )
+        db.session.commit()
+        return product.id
+
+
+def test_images_left_pending_by_a_lost_job_are_marked_failed(make_products):
+    make_products(2)
+    with app.app_context():
+        for product, prefix in zip(Product.query.order_by(Product.id), "ab"):
+            product.sku = f"SKU-{prefix * 4}"
+        db.session.commit()
+    lost = _pending_image("a" * 64, age=3600)
+    queued = _pending_image("b" * 64, age=10)
+
+    with app.app_context():
+        assert fail_stale_images(timeout=900) == 1
+
+        assert db.session.get(Asset, "a" * 64).status == "failed"
+        assert db.session.get(Asset, "b" * 64).status == "pending"
+        image = ProductImage.query.filter_by(product_id=lost).one()
+        assert (image.status, image.listing_url) == ("failed", None)
+        assert db.session.get(Product, lost).imgUrl == ""
+        assert db.session.get(Product, queued).imgUrl.endswith("_listing.webp")
@@ -0,0 +1,107 @@
+# tests/test_inventory.py
+from datetime import datetime
+
+from sqlalchemy import update
+
+from config import app, db
+from inventory import release_expired_holds
+from models import InventoryLog, Order, Product, StockHold
+
+CHECKOUT = "/api/v1/create-order/process"
+
+
+def _stock(product_id):
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        return product.stock, product.reserved
+
+
+def test_short_second_line_reports_only_that_line(client, make_products, order_payload):
+    first, second = make_products(2)
+
+    response = client.post(
+        CHECKOUT,
+        json=order_payload([(first, 5), (second, 6)], payment_status="paid"),
+    )
+
+    assert response.status_code == 409
+    assert response.json["shortfalls"] == [
+        {"product_id": second, "requested": 6, "available": 5, "short": 1}
+    ]
+    # The whole order was rolled back, first line included
+    assert _stock(first) == (5, 0)
+    with app.app_context():
+        assert Order.query.count() == 0
+        assert InventoryLog.query.count() == 0
+
+
+def test_short_second_line_of_a_hold_reports_only_that_line(
+    client, make_products, order_payload
+):
+    first, second = make_products(2)
+
+    response = client.post(CHECKOUT, json=order_payload([(first, 5), (second, 6)]))
+
+    assert response.status_code == 409
+    assert [line["product_id"] for line in response.json["shortfalls"]] == [second]
+    assert _stock(first) == (5, 0)
+
+
+def _place(client, order_payload, items, **order):
+    response = client.post(CHECKOUT, json=order_payload(items, **order))
+    assert response.status_code == 201
+    return response.json["order"]["id"]
+
+
+def test_paying_a_cash_order_does_not_sell_its_stock_again(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    order_id = _place(client, order_payload, [(product, 2)], payment_method="cash")
+    assert _stock(product) == (3, 0)
+
+    response = client.patch(
+        f"/api/v1/order/{order_id}", json={"payment_status": "paid"}
+    )
+
+    assert response.status_code == 200
+    assert _stock(product) == (3, 0)
+    with app.app_context():
+        assert InventoryLog.query.count() == 1
+
+
+def test_paying_a_held_order_sells_the_held_stock_once(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    order_id = _place(client, order_payload, [(product, 2)])
+    assert _stock(product) == (5, 2)
+
+    for status in ("paid", "pending", "paid"):
+        response = client.patch(
+            f"/api/v1/order/{order_id}", json={"payment_status": status}
+        )
+        assert response.status_code == 200
+
+    assert _stock(product) == (3, 0)
+    with app.app_context():
+        assert InventoryLog.query.count() == 1
+
+
+def test_paying_after_the_hold_expired_takes_the_stock_afresh(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    order_id = _place(client, order_payload, [(product, 2)])
+    with app.app_context():
+        db.session.execute(update(StockHold).values(expires_at=datetime(2000, 1, 1)))
+        db.session.commit()
+        assert release_expired_holds() == 2
+    assert _stock(product) == (5, 0)
+
+    response = client.patch(
+        f"/api/v1/order/{order_id}", json={"payment_status": "paid"}
+    )
+
+    assert response.status_code == 200
+    assert _stock(product) == (3, 0)
@@ -0,0 +1,99 @@
+# tests/test_orders.py
+import pytest
+
+from config import app, db
+from models import Address, Customer
+
+CHECKOUT = "/api/v1/create-order/process"
+
+
+def test_checkout_total_ignores_client_tax_and_discount(
+    client, make_products, order_payload
+):
+    first, second = make_products(2)  # priced 10 and 11
+
+    response = client.post(
+        CHECKOUT,
+        json=order_payload(
+            [(first, 2), (second, 1)],
+            total_amount=1,
+            tax_amount="1000",
+            discount_amount="500",
+        ),
+    )
+
+    assert response.status_code == 201
+    order = response.json["order"]
+    assert order["total_amount"] == 10 * 2 + 11 + 200
+    assert (order["tax_amount"], order["discount_amount"]) == (None, None)
+
+
+@pytest.mark.parametrize("items", [5, "SKU0", {"product_id": 1}, None, []])
+def test_checkout_rejects_order_items_that_are_not_a_list(
+    client, make_products, order_payload, items
+):
+    make_products(1)
+    payload = order_payload([])
+    payload["order_items"] = items
+
+    response = client.post(CHECKOUT, json=payload)
+
+    assert response.status_code == 400
+
+
+def _place(client, payload):
+    response = client.post(CHECKOUT, json=payload)
+    assert response.status_code == 201
+    return response.json["order"]
+
+
+def test_returning_customers_are_matched_by_email_in_any_case(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+
+    first = _place(client, order_payload([(product, 1)], email="Jane@Example.com"))
+    again = _place(client, order_payload([(product, 1)], email=" jane@example.COM "))
+    other = _place(client, order_payload([(product, 1)], email="john@example.com"))
+
+    assert again["customer_id"] == first["customer_id"]
+    assert other["customer_id"] != first["customer_id"]
+    with app.app_context():
+        assert Customer.query.count() == 2
+        # The first spelling is kept
+        assert db.session.get(Customer, first["customer_id"]).email == (
+            "Jane@Example.com"
+        )
+
+
+def test_addresses_are_matched_ignoring_case_and_spacing(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+    payload = order_payload([(product, 1)])
+    first = _place(client, payload)
+
+    payload["address"] = {
+        name: f"  {value.upper()}  " for name, value in payload["address"].items()
+    }
+    payload["address"]["specific_address"] = "1   KIMATHI  st"
+    again = _place(client, payload)
+
+    payload["address"]["specific_address"] = "2 Kimathi St"
+    moved = _place(client, payload)
+
+    assert again["shipping_address_id"] == first["shipping_address_id"]
+    assert moved["shipping_address_id"] != first["shipping_address_id"]
+    with app.app_context():
+        assert Address.query.count() == 2
+
+
+def test_the_same_address_belongs_to_each_customer_separately(
+    client, make_products, order_payload
+):
+    (product,) = make_products(1)
+
+    jane = _place(client, order_payload([(product, 1)], email="jane@example.com"))
+    john = _place(client, order_payload([(product, 1)], email="john@example.com"))
+
+    assert jane["shipping_address_id"] != john["shipping_address_id"]
@@ -0,0 +1,19 @@
+# tests/test_search.py
+from sqlalchemy import text
+
+from config import app, db
+from search import init_search_index
+
+
+def test_search_works_on_a_database_built_by_create_all(client, make_products):
+    first, second = make_products(2)
+    with app.app_context():
+        db.session.execute(text("DROP TABLE products_fts"))
+        db.session.commit()
+        init_search_index()
+        init_search_index()  # a second boot leaves the index alone
+
+    response = client.get("/api/v1/products/search?q=brake")
+
+    assert response.status_code == 200
+    assert sorted(hit["id"] for hit in response.json["content"]) == [first, second]
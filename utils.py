@@ -2,7 +2,14 @@ from datetime import datetime
 from config import db  # Assuming db and app are imported from config
 
 # Import the Role model (adjust the import path if necessary)
-import uuid
+import os
+import threading
+import time
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from cache import mark_tables_changed
 
 # from flask import request, jsonify, make_response
 # from sqlalchemy.exc import IntegrityError
@@ -17,6 +24,10 @@ data = [
     {"name": "super_admin", "level": 4},
 ]
 
+CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_ulid_last = (0, 0)
+
 
 def role_generator():
     for dataitem in data:
@@ -33,6 +44,13 @@ def role_generator():
 # role_generator()
 
 
+def dialect_insert(table):
+    """INSERT construct with on_conflict_do_update for the active database."""
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
 def str_to_bool(value):
     """Convert string values like 'true' or 'false' into real boolean"""
     if isinstance(value, bool):  # If it's already a boolean, return it
@@ -42,70 +60,120 @@ def str_to_bool(value):
     return False  # Default to False if None or invalid input
 
 
-def generate_unique_order_number():
-    """Generate a unique order number and check for uniqueness."""
-    while True:
-        order_number = f"ATS_{uuid.uuid4().hex[:6]}"  # Generate a random order number
-        existing_order = Order.query.filter_by(order_number=order_number).first()
+def ulid():
+    """26-character ULID: 48-bit millisecond time + 80 random bits, base32.
 
-        if not existing_order:
-            return order_number
+    Ids sort by creation time. Within a millisecond the random part is
+    incremented, so one process never repeats itself, and across processes
+    80 random bits make a collision negligible; no database lookup needed.
+    """
+    global _ulid_last
+    with _ulid_lock:
+        millis = time.time_ns() // 1_000_000
+        last_millis, last_random = _ulid_last
+        if millis <= last_millis:  # same millisecond, or the clock went back
+            millis, random_part = last_millis, last_random + 1
+            if random_part >> 80:
+                millis, random_part = millis + 1, int.from_bytes(os.urandom(10), "big")
+        else:
+            random_part = int.from_bytes(os.urandom(10), "big")
+        _ulid_last = (millis, random_part)
+    value = (millis << 80) | random_part
+    return "".join(
+        CROCKFORD_BASE32[(value >> shift) & 31] for shift in range(125, -1, -5)
+    )
 
 
-def generate_unique_tracking_number():
-    """Generate a unique order number and check for uniqueness."""
-    while True:
-        tracking_number = f"TN_{uuid.uuid4().hex[:6]}"  # Generate a random order number
-        existing_order = Order.query.filter_by(tracking_number=tracking_number).first()
+def _reset_ulid():
+    # A forked worker must not continue the parent's same-millisecond sequence
+    global _ulid_last
+    _ulid_last = (0, 0)
 
-        if not existing_order:
-            return tracking_number
 
+os.register_at_fork(after_in_child=_reset_ulid)
 
-def get_or_create_customer(data):
-    """Check if customer exists by email, return existing or create a new one."""
-    existing_customer = Customer.query.filter_by(email=data["email"]).first()
 
-    if existing_customer:
-        return existing_customer, False  # Return existing customer
+def generate_unique_order_number():
+    """Order number such as ATS_01JAB3..., unique without a lookup."""
+    return f"ATS_{ulid()}"
+
+
+def generate_unique_tracking_number():
+    """Tracking number such as TN_01JAB3..., unique without a lookup."""
+    return f"TN_{ulid()}"
 
-    customer = Customer(
-        first_name=data["first_name"],
-        last_name=data["last_name"],
-        email=data["email"],
-        phone=data.get("phone"),
-        user_id=data.get("user_id"),
+
+def _upsert(table, values, conflict, keep):
+    """INSERT ... ON CONFLICT DO UPDATE ... RETURNING id; returns (id, created).
+
+    The no-op update makes the existing row come back from RETURNING. The
+    row was created by this statement if it carries our created_at.
+    """
+    statement = (
+        dialect_insert(table)
+        .values(values)
+        .on_conflict_do_update(index_elements=conflict, set_={keep: table.c[keep]})
+        .returning(table.c.id, table.c.created_at)
     )
-    db.session.add(customer)
-    return customer, True  # Return new customer
+    row_id, created_at = db.session.execute(statement).one()
+    return row_id, created_at == values["created_at"]
 
 
-def get_or_create_address(data, customer_id):
-    """Ensure a valid, non-duplicate address is used for the customer."""
-    existing_address = Address.query.filter_by(
-        customer_id=customer_id,
-        specific_address=data["specific_address"],
-        county=data["county"],
-        area_town=data["area_town"],
-        city_town=data["city_town"],
-    ).first()
+def upsert_customer(data):
+    """Resolve the customer by email (case-insensitively) in one statement.
 
-    if existing_address:
-        return existing_address, False  # Return existing address
+    An existing customer is returned unchanged. Returns (customer_id, created).
+    """
+    table = Customer.__table__
+    customer_id, created = _upsert(
+        table,
+        {
+            "first_name": data["first_name"],
+            "last_name": data["last_name"],
+            "email": data["email"].strip(),
+            "phone": data.get("phone"),
+            "user_id": data.get("user_id"),
+            "created_at": datetime.utcnow(),
+        },
+        conflict=[func.lower(table.c.email)],
+        keep="email",
+    )
+    if created:
+        mark_tables_changed(db.session, "customers")
+    return customer_id, created
 
-    address = Address(
-        customer_id=customer_id,
-        specific_address=data["specific_address"],
-        county=data["county"],
-        area_town=data["area_town"],
-        city_town=data["city_town"],
+
+def upsert_address(data, customer_id):
+    """Resolve a customer's address by its normalized hash in one statement.
+
+    Returns (address_id, created).
+    """
+    table = Address.__table__
+    fields = {name: data[name] for name in Address.HASHED_FIELDS}
+    address_id, created = _upsert(
+        table,
+        {
+            **fields,
+            "customer_id": customer_id,
+            "address_hash": Address.hash_fields(fields),
+            "created_at": datetime.utcnow(),
+        },
+        conflict=[table.c.customer_id, table.c.address_hash],
+        keep="address_hash",
     )
-    db.session.add(address)
-    return address, True  # Return new address
+    if created:
+        mark_tables_changed(db.session, "addresses")
+    return address_id, created
 
 
-def create_order(data, customer_id, address_id):
-    """Create an order after validating dependencies."""
+def create_order(data, customer_id, address_id, items_total):
+    """Create an order after validating dependencies.
+
+    The total is the server-priced items total plus shipping; the client's
+    total_amount is ignored. Prices include tax and the items total already
+    has the products' discounts, so a client's tax_amount and discount_amount
+    are ignored too rather than stored next to a total they do not add up to.
+    """
     order_number = generate_unique_order_number()
     tracking_number = generate_unique_tracking_number()
     estimated_delivery_date_str = data.get("estimated_delivery_date")
@@ -124,15 +192,13 @@ def create_order(data, customer_id, address_id):
         customer_id=customer_id,
         order_number=order_number,
         status=data["status"],  # Accessing data from passed 'order' object
-        total_amount=data["total_amount"],
+        total_amount=round(items_total + _amount(data.get("shipping_cost")), 2),
         shipping_address_id=address_id,
         billing_address_id=address_id,
         payment_method=data["payment_method"],
         payment_status=data["payment_status"],
         shipping_method=data.get("shipping_method"),
         shipping_cost=data.get("shipping_cost"),
-        tax_amount=data.get("tax_amount"),
-        discount_amount=data.get("discount_amount"),
         notes=data.get("notes"),
         delivery_company=data.get("delivery_company"),
         tracking_number=tracking_number,
@@ -144,23 +210,68 @@ def create_order(data, customer_id, address_id):
     return order
 
 
-def create_order_items(items, order_id):
-    """Add order items ensuring products exist."""
-    for item_data in items:
-        product = Product.query.get(item_data["product_id"])
-        if not product:
-            raise ValueError(f"Product ID {item_data['product_id']} not found.")
+def _amount(value):
+    if value in (None, ""):
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}.")
+
+
+def price_order_items(items):
+    """Validate order lines with one product query and price them server-side.
 
-        if item_data["quantity"] <= 0:
+    Unit prices are the products' current effective (discounted) prices.
+    Returns (order item rows without order_id, items total).
+    """
+    if not isinstance(items, list):
+        raise ValueError("order_items must be a list.")
+    if not items:
+        raise ValueError("Order has no items.")
+    lines = []
+    for item in items:
+        try:
+            product_id, quantity = int(item["product_id"]), int(item["quantity"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid order item: {item}.")
+        if quantity <= 0:
             raise ValueError(
-                f"Invalid quantity ({item_data['quantity']}) for Product ID {item_data['product_id']}."
+                f"Invalid quantity ({quantity}) for Product ID {product_id}."
+            )
+        lines.append((product_id, quantity))
+
+    product_ids = {product_id for product_id, _ in lines}
+    prices = dict(
+        db.session.execute(
+            select(Product.id, Product.effective_price).where(
+                Product.id.in_(product_ids)
             )
+        ).all()
+    )
+    missing = sorted(product_ids - prices.keys())
+    if missing:
+        raise ValueError(f"Product ID {', '.join(map(str, missing))} not found.")
 
-        order_item = OrderItem(
-            order_id=order_id,
-            product_id=item_data["product_id"],
-            quantity=item_data["quantity"],
-            unit_price=item_data["unit_price"],
-            total_price=item_data["total_price"],
+    rows, items_total = [], 0.0
+    for product_id, quantity in lines:
+        unit_price = round(prices[product_id], 2)
+        total_price = round(unit_price * quantity, 2)
+        rows.append(
+            {
+                "product_id": product_id,
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "total_price": total_price,
+            }
         )
-        db.session.add(order_item)
+        items_total += total_price
+    return rows, round(items_total, 2)
+
+
+def create_order_items(rows, order_id):
+    """Insert the priced rows from price_order_items in one executemany."""
+    db.session.execute(
+        insert(OrderItem), [{**row, "order_id": order_id} for row in rows]
+    )
+    mark_tables_changed(db.session, "order_items")